@@ -0,0 +1,96 @@
+"""
+Recall/latency benchmark for the IVF face index against exact search.
+
+Builds a synthetic gallery of clustered embeddings (several noisy samples
+per identity, like real enrolments), then queries it with fresh noisy
+samples and reports recall@1 / recall@k and mean query time for each
+nprobe value.
+
+Usage:
+    python -m benchmarks.index_recall --size 100000 --nprobe 1 4 8 16 32
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+
+from src.util.face_gallery import normalize
+from src.util.face_index import IVFIndex, exact_search
+
+
+def make_gallery(size, dim, per_identity, noise, rng):
+    """Return a normalised (size, dim) gallery grouped by identity."""
+    identities = normalize(rng.standard_normal((size // per_identity + 1, dim)))
+    owner = np.arange(size) // per_identity
+    gallery = identities[owner] + noise * rng.standard_normal((size, dim)).astype(np.float32)
+    return normalize(gallery), identities, owner
+
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    gallery, identities, owner = make_gallery(args.size, args.dim, args.per_identity, args.noise, rng)
+
+    picked = rng.choice(args.size, args.queries, replace=False)
+    queries = normalize(identities[owner[picked]]
+                        + args.noise * rng.standard_normal((args.queries, args.dim)).astype(np.float32))
+
+    start = time.perf_counter()
+    truth = [exact_search(gallery, q, args.k)[0] for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+    index = IVFIndex(nlist=args.nlist, min_train_size=1, index_path=None, background=False)
+    start = time.perf_counter()
+    index.attach(range(args.size), gallery)
+    train_s = time.perf_counter() - start
+
+    report = {
+        "size": args.size,
+        "dim": args.dim,
+        "nlist": int(index.centroids.shape[0]),
+        "train_seconds": round(train_s, 3),
+        "exact_ms": round(exact_ms, 3),
+        "runs": [],
+    }
+
+    for nprobe in args.nprobe:
+        index.nprobe = nprobe
+        hits_at_1 = hits_at_k = 0
+
+        start = time.perf_counter()
+        found = [index.search(gallery, q, args.k)[0] for q in queries]
+        ivf_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+        for rows, expected in zip(found, truth):
+            hits_at_1 += bool(len(rows)) and rows[0] == expected[0]
+            hits_at_k += len(set(rows.tolist()) & set(expected.tolist()))
+
+        report["runs"].append({
+            "nprobe": nprobe,
+            "recall_at_1": round(hits_at_1 / args.queries, 4),
+            f"recall_at_{args.k}": round(hits_at_k / (args.queries * args.k), 4),
+            "ivf_ms": round(ivf_ms, 3),
+            "speedup": round(exact_ms / ivf_ms, 2) if ivf_ms else None,
+        })
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000, help="number of gallery embeddings")
+    parser.add_argument("--dim", type=int, default=128, help="embedding size")
+    parser.add_argument("--per-identity", type=int, default=1, help="embeddings per synthetic person")
+    parser.add_argument("--noise", type=float, default=0.05, help="per-sample noise around each identity")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None, help="IVF clusters (default about sqrt(size))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
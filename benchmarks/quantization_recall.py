@@ -0,0 +1,93 @@
+"""
+Accuracy/memory/latency benchmark for quantised embedding storage.
+
+Builds the same kind of synthetic gallery as index_recall, stores it in
+each encoding and compares exact search against the float32 results:
+top-1 agreement, recall@k, the largest score error, gallery memory and
+mean query time. int8 is kept as an Int8Matrix, which saves memory but
+scores in float32 chunk by chunk; float16 is decoded back to float32 as
+the gallery does.
+
+Usage:
+    python -m benchmarks.quantization_recall --size 100000 --dim 128
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+
+from benchmarks.index_recall import make_gallery
+from src.util.face_gallery import normalize
+from src.util.face_index import exact_search
+from src.util.quantization import Int8Matrix, decode_blob, encode_features
+
+
+def stored_gallery(gallery, encoding):
+    """The gallery as FaceGallery would hold it after a round trip through the database."""
+    if encoding == "int8":
+        return Int8Matrix.from_float(gallery)
+    if encoding == "float16":
+        return normalize(gallery.astype(np.float16).astype(np.float32))
+    return gallery
+
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    gallery, identities, owner = make_gallery(args.size, args.dim, args.per_identity, args.noise, rng)
+
+    picked = rng.choice(args.size, args.queries, replace=False)
+    queries = normalize(identities[owner[picked]]
+                        + args.noise * rng.standard_normal((args.queries, args.dim)).astype(np.float32))
+    truth = [exact_search(gallery, q, args.k) for q in queries]
+
+    report = {"size": args.size, "dim": args.dim, "runs": []}
+    for encoding in args.encodings:
+        stored = stored_gallery(gallery, encoding)
+        hits_at_1 = hits_at_k = 0
+        max_error = 0.0
+
+        start = time.perf_counter()
+        found = [exact_search(stored, q, args.k) for q in queries]
+        query_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+        for (rows, scores), (expected, expected_scores) in zip(found, truth):
+            hits_at_1 += rows[0] == expected[0]
+            hits_at_k += len(set(rows.tolist()) & set(expected.tolist()))
+            max_error = max(max_error, float(np.abs(scores[0] - expected_scores[0])))
+
+        report["runs"].append({
+            "encoding": encoding,
+            "blob_bytes": len(encode_features(gallery[0], encoding)),
+            "memory_mb": round(stored.nbytes / 2**20, 2),
+            "top1_agreement": round(hits_at_1 / args.queries, 4),
+            f"recall_at_{args.k}": round(hits_at_k / (args.queries * args.k), 4),
+            "max_top1_score_error": round(max_error, 5),
+            "query_ms": round(query_ms, 3),
+        })
+
+    # Sanity check that the stored form decodes back to the same vector
+    for encoding in args.encodings:
+        decoded = decode_blob(encode_features(gallery[0], encoding))
+        report[f"{encoding}_roundtrip_error"] = round(float(np.abs(decoded - gallery[0]).max()), 6)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000, help="number of gallery embeddings")
+    parser.add_argument("--dim", type=int, default=128, help="embedding size")
+    parser.add_argument("--per-identity", type=int, default=1, help="embeddings per synthetic person")
+    parser.add_argument("--noise", type=float, default=0.05, help="per-sample noise around each identity")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--encodings", nargs="+", default=["float32", "float16", "int8"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
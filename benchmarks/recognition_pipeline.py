@@ -0,0 +1,220 @@
+"""
+Headless benchmark of the recognition hot path.
+
+Feeds a video file or a directory of images through the same calls the
+recognition screen makes (frame read, detect_faces_full, quality gate,
+extract_features_aligned) and then matches every embedding against
+synthetic galleries of the given sizes, loaded through FaceGallery from a
+temporary database. Reports per-stage latency percentiles, frames/s and
+peak RSS as JSON.
+
+Without --source only the matching stage is measured, using synthetic
+queries; this needs no models or camera.
+
+Usage:
+    python -m benchmarks.recognition_pipeline --source clips/door.mp4 --frames 300 --gallery-size 1 1000 100000
+    python -m benchmarks.recognition_pipeline --gallery-size 1 10000 1000000 --encoding int8 --ivf
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+from benchmarks.index_recall import make_gallery
+from src.util import face_manager
+from src.util.camera_source import FileSource
+from src.util.db import close_connection
+from src.util.face_gallery import FaceGallery, normalize
+from src.util.face_index import FlatIndex, IVFIndex
+from src.util.face_quality import QualityGate
+from src.util.quantization import encode_features
+
+
+class StageTimes:
+    """Durations per named stage."""
+
+    def __init__(self):
+        self.samples = {}
+
+    def record(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def total(self, stage):
+        return sum(self.samples.get(stage, ()))
+
+    def summary(self):
+        report = {}
+        for stage, values in self.samples.items():
+            ms = np.asarray(values) * 1000
+            report[stage] = {
+                "count": int(ms.size),
+                "mean_ms": round(float(ms.mean()), 3),
+                "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                "p90_ms": round(float(np.percentile(ms, 90)), 3),
+                "p99_ms": round(float(np.percentile(ms, 99)), 3),
+                "max_ms": round(float(ms.max()), 3),
+            }
+        return report
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, or None where unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def run_frames(source_path, frames, timings):
+    """
+    Run read/detect/quality/embed over up to `frames` frames.
+    Returns (embeddings, stats) where embeddings is (N, D).
+    """
+    from src.util.image_manager import ImageManager
+
+    image_manager = ImageManager()
+    gate = QualityGate()
+    h, w = image_manager.face_size
+    # Warm-up, and the embedding size for the synthetic gallery
+    dim = image_manager.extract_features(np.zeros((h, w, 3), dtype=np.uint8)).shape[0]
+
+    source = FileSource(source_path, loop=True).start()
+    embeddings, detected, seq = [], 0, 0
+    processed = 0
+    try:
+        while processed < frames:
+            start = time.perf_counter()
+            seq, frame = source.wait_for(seq, timeout=5.0)
+            if frame is None:
+                break
+            read_done = time.perf_counter()
+            timings.record("read", read_done - start)
+
+            faces = image_manager.detect_faces_full(frame)
+            detect_done = time.perf_counter()
+            timings.record("detect", detect_done - read_done)
+            detected += len(faces)
+
+            faces = faces[gate.filter(frame, faces)]
+            quality_done = time.perf_counter()
+            timings.record("quality", quality_done - detect_done)
+
+            if len(faces):
+                embeddings.append(image_manager.extract_features_aligned(frame, faces))
+                timings.record("embed", time.perf_counter() - quality_done)
+
+            timings.record("frame", time.perf_counter() - start)
+            processed += 1
+    finally:
+        source.stop()
+
+    stats = {
+        "frames": processed,
+        "faces_detected": detected,
+        "faces_embedded": sum(len(e) for e in embeddings),
+        "quality_gate": gate.stats(),
+    }
+    matrix = np.vstack(embeddings) if embeddings else np.empty((0, dim), dtype=np.float32)
+    return matrix, stats
+
+
+def build_gallery(size, dim, args, directory, rng):
+    """Write a synthetic gallery to a fresh database and load it through FaceGallery."""
+    face_manager.DB_PATH = os.path.join(directory, f"gallery_{size}.db")
+    face_manager.init_db()
+    conn = face_manager.connect()
+
+    chunk = 50000
+    for start in range(0, size, chunk):
+        count = min(chunk, size - start)
+        vectors, _, _ = make_gallery(count, dim, 1, args.noise, rng)
+        with conn:
+            conn.executemany(
+                "INSERT INTO faces (name, relation, image_path, features) VALUES (?, ?, ?, ?)",
+                ((f"person_{start + i}", "synthetic", "", encode_features(vectors[i], args.encoding))
+                 for i in range(count)))
+
+    index = IVFIndex(nprobe=args.nprobe, min_train_size=1, index_path=None, background=False) if args.ivf else FlatIndex()
+    start = time.perf_counter()
+    gallery = FaceGallery(index=index, auto_update=False, quantized=args.encoding == "int8")
+    return gallery, time.perf_counter() - start
+
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    frame_timings = StageTimes()
+    report = {"source": args.source, "encoding": args.encoding,
+              "index": "ivf" if args.ivf else "flat", "galleries": []}
+
+    if args.source:
+        queries, stats = run_frames(args.source, args.frames, frame_timings)
+        report.update(stats)
+        report["stages"] = frame_timings.summary()
+        frame_seconds = frame_timings.total("frame")
+        report["frames_per_second"] = round(stats["frames"] / frame_seconds, 2) if frame_seconds else None
+        dim = queries.shape[1]
+        if len(queries) == 0:
+            print("No face passed detection and the quality gate; matching uses synthetic queries.",
+                  file=sys.stderr)
+            queries = normalize(rng.standard_normal((args.queries, dim)))
+    else:
+        dim = args.dim
+        queries = normalize(rng.standard_normal((args.queries, dim)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.gallery_size:
+            gallery, load_seconds = build_gallery(size, dim, args, directory, rng)
+            timings = StageTimes()
+            for query in queries:
+                start = time.perf_counter()
+                gallery.best_match(query)
+                timings.record("match", time.perf_counter() - start)
+
+            entry = {"gallery_size": size, "load_seconds": round(load_seconds, 3),
+                     "stages": timings.summary()}
+            if args.source and report["frames"]:
+                # Frames/s if every embedded face of every frame is also matched
+                total = frame_timings.total("frame") + timings.total("match")
+                entry["frames_per_second"] = round(report["frames"] / total, 2)
+            report["galleries"].append(entry)
+
+            gallery.close()
+            close_connection(face_manager.DB_PATH)
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", help="video file or directory of images (default: matching only)")
+    parser.add_argument("--frames", type=int, default=300, help="frames to process from the source")
+    parser.add_argument("--gallery-size", type=int, nargs="+", default=[1, 1000, 100000])
+    parser.add_argument("--dim", type=int, default=128, help="embedding size without --source")
+    parser.add_argument("--queries", type=int, default=500, help="synthetic queries without --source")
+    parser.add_argument("--noise", type=float, default=0.05, help="per-sample noise of synthetic faces")
+    parser.add_argument("--encoding", choices=("float32", "float16", "int8"), default="float32")
+    parser.add_argument("--ivf", action="store_true", help="search with IVFIndex instead of exact search")
+    parser.add_argument("--nprobe", type=int, default=None,
+                        help="IVF clusters scanned per query (default: 30%% of them)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,19 @@
 This is the main entry point of the app. It initializes the
 ScreenManager, handles navigation, and sets up the face analysis model.
 """
+from src.util.startup_timer import startup_timer
 import logging
 logging.getLogger("tensorflow").setLevel(logging.ERROR)
 import numpy as np
 import cv2
+import os
+import sys
+import json
+import subprocess
 
 from kivy.uix.scrollview import ScrollView
 from kivymd.app import MDApp
 from kivymd.uix.dialog import MDDialog
-from kivymd.uix.list import MDList, IconRightWidget, TwoLineAvatarIconListItem, ImageLeftWidget
 from kivymd.uix.screen import Screen
 from kivymd.uix.label import MDLabel
 from kivymd.uix.button import MDRaisedButton, MDFlatButton, MDRectangleFlatButton, MDFillRoundFlatIconButton, MDFloatingActionButton
@@ -21,16 +25,28 @@ from kivy.core.window import Window
 from kivymd.uix.navigationdrawer import MDNavigationDrawer
 from kivy.uix.screenmanager import ScreenManager, SlideTransition
 from kivy.metrics import dp
+from kivy.utils import platform
 
-from src.util.face_manager import init_db, manage_face, delete_face, get_name_by_id,save_recognition,get_all_results, clear_recognition_history
+from src.util.face_manager import init_db, get_faces_page, delete_face, get_name_by_id,save_recognition,get_results_page, clear_recognition_history
 from src.add_face import AddFaceScreen
 from src.recognition import RecognitionScreen
 from src.ui.helpers import screen_helper
-from src.util.voice_manager import VoiceManager
+from src.util.thumbnail_cache import load_thumbnail
+from src.util.registry import get_voice_manager, get_history_writer, get_gallery, is_loaded, preload
+from src.util import bulk_import
+from src.util.realign import realign_faces
+from src.util.metrics import metrics, DUMP_PATH, DUMP_INTERVAL
 from threading import Thread
 from functools import partial
 from kivy.clock import Clock
 
+startup_timer.mark("imports")
+
+HISTORY_PAGE_SIZE = 30  # history rows fetched per page
+FACES_PAGE_SIZE = 30  # face rows fetched per page
+HISTORY_FLUSH_TIMEOUT = 0.5  # seconds the history screen waits for queued rows
+IMPORT_REPORT_PATH = "import_failures.csv"  # photos the last bulk import could not use
+
 class LoginScreen(Screen):
     pass
 
@@ -47,7 +63,7 @@ class FacesScreen(Screen):
     pass
 
 class TransferScreen(Screen):
-    """Placeholder screen for data import/export functionality."""
+    """Imports faces in bulk from a folder or CSV file of labelled photos."""
     pass
 
 class FaceInfoScreen(Screen):
@@ -92,13 +108,29 @@ class MyApp(MDApp):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.voice_manager = VoiceManager()
         self.face_info = {}  # Store temporary info about the face being added
+        self.history_cursor = None  # (timestamp, id) of the last loaded history row
+        self.history_exhausted = False
+        self.history_loading = False  # a page is being fetched on a worker thread
+        self.history_generation = 0  # bumped on every reload; older pages are dropped
+        self.faces_cursor = None  # id of the last loaded face
+        self.faces_exhausted = False
+        self.import_thread = None
+
+        with startup_timer.phase("init_db"):
+            init_db()
 
-        init_db()
+    @property
+    def voice_manager(self):
+        return get_voice_manager()
 
     def build(self):
         """Initialize the ScreenManager and load the UI from screen_helper."""
+        with startup_timer.phase("build ui"):
+            return self.build_screens()
+
+    def build_screens(self):
+        """Create the ScreenManager and add every screen to it."""
         self.theme_cls.primary_palette = 'Teal'
         self.sm = MyScreenManager(transition=SlideTransition(direction="left"))
 
@@ -128,6 +160,38 @@ class MyApp(MDApp):
         self.sm.current = "main"
         self.go_home()
 
+        # Load models and TTS in the background while the home screen shows
+        Clock.schedule_once(lambda dt: startup_timer.mark("first frame"))
+        preload(on_done=self.on_preloaded)
+
+        # Periodic metrics file (FACEAPP_METRICS=1 and FACEAPP_METRICS_FILE)
+        if DUMP_PATH:
+            metrics.start_dump(DUMP_PATH, DUMP_INTERVAL)
+
+
+    def on_preloaded(self):
+        """Preload thread: report startup times, then re-embed faces enrolled before alignment."""
+        Clock.schedule_once(lambda dt: startup_timer.report())
+        try:
+            _, failed = realign_faces()
+        except Exception as e:
+            print(f"Error re-embedding faces: {e}")
+            return
+
+        # Failed faces are recorded and skipped later, so this is shown only once
+        if failed:
+            names = ", ".join(get_name_by_id(face_id) or str(face_id) for face_id in failed)
+            message = (f"These faces were saved by an older version and could not be updated. "
+                       f"Please delete and add them again: {names}")
+            Clock.schedule_once(lambda dt: self.show_message(message))
+
+    def on_stop(self):
+        """Write any queued recognition history and save the face index before the app exits."""
+        if is_loaded("history_writer"):
+            get_history_writer().close()
+        if is_loaded("gallery"):
+            get_gallery().close()
+        metrics.stop_dump()
 
     def check_login(self, password):
         user_password = "1234"  
@@ -293,75 +357,135 @@ class MyApp(MDApp):
         content_area.add_widget(button)
 
     def manage_face(self):
-        """Go to the faces list screen and load data from the database."""
-        self.previous_screen = self.sm.current
+        """Go to the faces list screen and load the first page of faces."""
+        if self.sm.current != "db":
+            self.previous_screen = self.sm.current
         self.sm.transition.direction = "left"
         self.sm.current = "db"
 
-        faces_list = self.root.get_screen('db').ids.faces_list
-        faces_list.clear_widgets()
         faces_screen = self.root.get_screen('db')
+        faces_screen.ids.faces_list.data = []
+        faces_screen.ids.faces_list.scroll_y = 1
+        self.faces_cursor = None
+        self.faces_exhausted = False
+        self.load_faces_page()
+
+        faces_screen.ids.faces_empty.text = (
+            "" if faces_screen.ids.faces_list.data else "No face data found.")
+
+    def load_faces_page(self):
+        """Append the next page of faces to the faces list."""
+        if self.faces_exhausted:
+            return
 
-        faces = manage_face()  # Fetch stored face data
+        faces_list = self.root.get_screen('db').ids.faces_list
+        faces = get_faces_page(limit=FACES_PAGE_SIZE, after=self.faces_cursor)
+        if len(faces) < FACES_PAGE_SIZE:
+            self.faces_exhausted = True
         if not faces:
-            no_data_label = MDLabel(
-                text="No face data found.",
-                halign="center",
-                theme_text_color="Secondary",
-            )
-            faces_screen.add_widget(no_data_label)
             return
 
+        self.faces_cursor = faces[-1][0]
+        rows = []
         for face_id, name, relation, image_path in faces:
-            item = TwoLineAvatarIconListItem(text=name, secondary_text=relation)
-            item.add_widget(ImageLeftWidget(source=image_path))
-
-            delete_btn = IconRightWidget(icon="delete")
-            delete_btn.bind(on_release=lambda instance, fid=face_id: self.confirm_delete(fid))
+            row = {"text": name, "secondary_text": relation, "face_id": face_id}
+            row["source"] = load_thumbnail(image_path, partial(self.show_thumbnail, faces_list, row))
+            rows.append(row)
+        faces_list.data.extend(rows)
 
-            edit_btn = IconRightWidget(icon="pencil")
-            # If needed, you could bind it like:
-            # edit_btn.bind(on_release=lambda instance, fid=face_id: self.update(fid))
-
-            item.add_widget(delete_btn)
-            faces_list.add_widget(item)
+    def on_faces_scroll(self, faces_list):
+        """Fetch the next page when the list is scrolled near the bottom."""
+        if faces_list.data and faces_list.scroll_y <= 0.1:
+            self.load_faces_page()
 
     def clear_history(self):
         """Clear the history list and remove all history data from the database."""
-        clear_recognition_history()
-        self.see_history()
+        def run():
+            # Queued rows are written first so none reappear after clearing
+            if is_loaded("history_writer"):
+                get_history_writer().flush(timeout=5.0)
+            clear_recognition_history()
+            Clock.schedule_once(lambda dt: self.see_history())
+
+        Thread(target=run, name="clear-history", daemon=True).start()
 
 
     def see_history(self):
-        """Go to the faces list screen and load data from the database."""
-        self.previous_screen = self.sm.current
+        """Go to the history screen and load the first page of results."""
+        if self.sm.current != "history":
+            self.previous_screen = self.sm.current
         self.sm.transition.direction = "left"
         self.sm.current = "history"
 
-        history_list = self.root.get_screen('history').ids.history_list
-        history_list.clear_widgets()
         history_screen = self.root.get_screen('history')
+        history_screen.ids.history_list.data = []
+        history_screen.ids.history_list.scroll_y = 1
+        history_screen.ids.history_empty.text = ""
+        self.history_cursor = None
+        self.history_exhausted = False
+        self.history_loading = False
+        self.history_generation += 1
+        self.load_history_page(flush=True)
+
+    def load_history_page(self, flush=False):
+        """
+        Fetch the next page of results on a worker thread and append it to
+        the history list. With `flush`, rows still queued by the history
+        writer are written first.
+        """
+        if self.history_exhausted or self.history_loading:
+            return
+        self.history_loading = True
+        generation, cursor = self.history_generation, self.history_cursor
+
+        def run():
+            history = []
+            try:
+                if flush and is_loaded("history_writer"):
+                    get_history_writer().flush(timeout=HISTORY_FLUSH_TIMEOUT)
+                history = get_results_page(limit=HISTORY_PAGE_SIZE, before=cursor)
+            except Exception as e:
+                print(f"Error loading history: {e}")
+            Clock.schedule_once(lambda dt: self.show_history_page(generation, history))
+
+        Thread(target=run, name="history-page", daemon=True).start()
+
+    def show_history_page(self, generation, history):
+        """Append a page fetched by load_history_page, unless the list was reloaded since."""
+        if generation != self.history_generation:
+            return
+        self.history_loading = False
 
-        history = get_all_results()  # Fetch stored face data
-
+        history_screen = self.root.get_screen('history')
+        history_list = history_screen.ids.history_list
+        if len(history) < HISTORY_PAGE_SIZE:
+            self.history_exhausted = True
+        history_screen.ids.history_empty.text = (
+            "" if history_list.data or history else "No history found.")
         if not history:
-            no_data_label = MDLabel(
-                text="No history found.",
-                halign="center",
-                theme_text_color="Secondary",
-            )
-            history_screen.add_widget(no_data_label)
             return
 
-        for name, relation, image_path, result, timestamp  in history:
-            item = TwoLineAvatarIconListItem(text=name, secondary_text=relation)
-            item.add_widget(ImageLeftWidget(source=image_path))
+        last = history[-1]
+        self.history_cursor = (last[5], last[0])
+        rows = []
+        for _, name, relation, image_path, result, timestamp in history:
+            row = {"text": name, "secondary_text": relation}
+            row["source"] = load_thumbnail(image_path, partial(self.show_thumbnail, history_list, row))
+            rows.append(row)
+        history_list.data.extend(rows)
 
-            # delete_btn = IconRightWidget(icon="delete")
-            # delete_btn.bind(on_release=lambda instance, fid=face_id: self.confirm_delete(fid))
+    def on_history_scroll(self, history_list):
+        """Fetch the next page when the list is scrolled near the bottom."""
+        if history_list.data and history_list.scroll_y <= 0.1:
+            self.load_history_page()
 
-            # item.add_widget(delete_btn)
-            history_list.add_widget(item)
+    def show_thumbnail(self, list_widget, row, thumb_path):
+        """Put a thumbnail created in the background into its list row (any thread)."""
+        def update(dt):
+            row["source"] = thumb_path
+            list_widget.refresh_from_data()
+
+        Clock.schedule_once(update)
 
     def confirm_delete(self, face_id):
         """Show a confirmation dialog before deleting a face record."""
@@ -427,6 +551,82 @@ class MyApp(MDApp):
         add_face_screen = self.root.get_screen("add")
         add_face_screen.receive_face_info(name, relation)
 
+    def open_transfer(self):
+        """Go to the data transfer screen."""
+        self.previous_screen = self.sm.current
+        self.sm.transition.direction = "left"
+        self.sm.current = "transfer"
+
+    def import_faces(self, path):
+        """Start a bulk import of the folder or CSV file at path in the background."""
+        path = path.strip()
+        if not path or not os.path.exists(path):
+            self.show_message("Please enter an existing folder or CSV file.")
+            return
+        if self.import_thread is not None and self.import_thread.is_alive():
+            return
+
+        ids = self.root.get_screen("transfer").ids
+        ids.import_button.disabled = True
+        ids.import_progress.value = 0
+        ids.import_status.text = "Starting import..."
+        self.import_thread = Thread(target=self.run_import, args=(path,), daemon=True)
+        self.import_thread.start()
+
+    def run_import(self, path):
+        """Background thread: run the importer and report its progress."""
+        def progress(done, total):
+            Clock.schedule_once(partial(self.update_import_progress, done, total))
+
+        try:
+            if platform == "android":
+                # No worker processes on Android; import on this thread
+                summary = bulk_import.import_faces(path, workers=0, report_path=IMPORT_REPORT_PATH,
+                                                   on_progress=progress)
+            else:
+                # A separate process, so the pool's workers don't start from the Kivy app
+                summary = None
+                process = subprocess.Popen(
+                    [sys.executable, "-m", "src.util.bulk_import", path,
+                     "--progress", "--report", IMPORT_REPORT_PATH],
+                    stdout=subprocess.PIPE, text=True)
+                for line in process.stdout:
+                    try:
+                        data = json.loads(line)
+                    except ValueError:
+                        continue
+                    if "done" in data:
+                        progress(data["done"], data["total"])
+                    else:
+                        summary = data
+                if process.wait() != 0 or summary is None:
+                    raise RuntimeError(f"importer exited with code {process.returncode}")
+                if is_loaded("gallery"):
+                    get_gallery().load()
+
+            message = (f"Imported {summary['imported']} of {summary['people']} people"
+                       f" ({summary['skipped']} already imported).")
+            if summary["photos_failed"]:
+                message += f"\n{summary['photos_failed']} photos could not be used, see {IMPORT_REPORT_PATH}."
+        except Exception as e:
+            print(f"Error importing faces: {e}")
+            message = f"Import failed: {e}"
+        Clock.schedule_once(partial(self.finish_import, message))
+
+    def update_import_progress(self, done, total, *args):
+        """Main thread: show how many people have been processed."""
+        ids = self.root.get_screen("transfer").ids
+        ids.import_progress.value = 100 * done / total if total else 100
+        ids.import_status.text = f"{done} / {total} people"
+
+    def finish_import(self, message, *args):
+        """Main thread: show the import summary."""
+        ids = self.root.get_screen("transfer").ids
+        ids.import_button.disabled = False
+        ids.import_progress.value = 100
+        ids.import_status.text = message
+        self.voice_manager.speak("Face import finished.")
+
     def show_message(self, message):
         """Display a popup dialog with a message."""
         self.dialog = MDDialog(
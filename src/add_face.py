@@ -6,18 +6,30 @@ them in the local database.
 
 from kivymd.app import MDApp
 import cv2
-import numpy as np
 import os
+import threading
 import time
+from functools import partial
 from kivy.clock import Clock
-from kivy.graphics.texture import Texture
-from kivy.uix.image import Image
 from kivy.uix.screenmanager import Screen
-from kivy.uix.boxlayout import BoxLayout
-from kivymd.uix.label import MDLabel
 from src.util.face_manager import save_face_data
-from src.util.voice_manager import VoiceManager
-from src.util.image_manager import ImageManager
+from src.ui.display_texture import DisplayTexture
+from src.util.camera_source import CameraSource
+from src.util.enrollment import EnrollmentSamples
+from src.util.face_quality import QualityGate, quality_score
+from src.util.thumbnail_cache import create_thumbnail
+from src.util.registry import get_image_manager, get_voice_manager
+
+
+# What to tell the user when the quality gate rejects their face
+QUALITY_INSTRUCTIONS = {
+    "invalid_box": "Please look at the camera.",
+    "out_of_frame": "Please move your face to the centre of the screen.",
+    "too_small": "Please move closer to the camera.",
+    "too_dark": "Please move to a brighter place.",
+    "too_bright": "Please move away from the bright light.",
+    "blurry": "Please hold still.",
+}
 
 
 class SuccessScreen(Screen):
@@ -39,18 +51,31 @@ class AddFaceScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.face_info = {}
-        self.voice_manager = VoiceManager()
-        self.image_manager= ImageManager()
 
-        self.capture = None  # camera instance
+        self.capture = None  # CameraSource, reads frames on its own thread
+        self.last_seq = 0  # sequence number of the last frame shown
         self.clock_event = None  # scheduled clock event
-        self.captured_features = []  # face embedding list
-        self.captured_images = []  # face image list
-        self.capture_count = 0  # how many images we captured
+        self.samples = EnrollmentSamples(capacity=20, duplicate_threshold=0.8)
+        self.quality_gate = QualityGate()  # skips faces too poor to enroll
+        self.worker = None  # enrollment thread, see enroll_loop
+        self.display = DisplayTexture()  # live camera feed
 
         # Capture state
         self.is_capturing = False
-    
+
+    # Shared instances, created on first use (see registry.preload)
+    @property
+    def voice_manager(self):
+        return get_voice_manager()
+
+    @property
+    def image_manager(self):
+        return get_image_manager()
+
+    @property
+    def capture_count(self):
+        return self.samples.count
+
     def receive_face_info(self, name, relation):
         """Receive name and relation from FaceInfoScreen."""
         self.face_info["name"] = name
@@ -61,15 +86,16 @@ class AddFaceScreen(Screen):
         self.is_capturing = True
         self.ids.progress_bar.value = 0
         self.last_speech_time = 0 
-        self.capture_count = 0
-        self.captured_features = []
-        self.captured_images = [] 
+        self.samples.reset()
 
-        self.capture = cv2.VideoCapture(self.current_camera)
+        self.capture = CameraSource(self.current_camera).start()
+        self.last_seq = 0
         Clock.schedule_interval(self.update_frame, 1.0 / 30) 
-        Clock.schedule_interval(self.capture_face, 0.2)
 
-        self.capture_face()
+        # Capture runs as fast as detection and embedding allow
+        self.worker = threading.Thread(
+            target=self.enroll_loop, args=(self.capture,), name="enrollment", daemon=True)
+        self.worker.start()
 
     def on_leave(self, *args):
         """Stop the camera when exiting this screen."""
@@ -77,96 +103,102 @@ class AddFaceScreen(Screen):
 
     def stop_camera(self):
         """Release camera resources."""
+        self.is_capturing= False
         if self.capture:
-            self.capture.release()
+            self.capture.stop()
             self.capture = None
-        self.is_capturing= False
+        if self.worker and self.worker is not threading.current_thread():
+            self.worker.join(1.0)
+        self.worker = None
 
         Clock.unschedule(self.update_frame)
-        Clock.unschedule(self.capture_face)
 
     def update_frame(self, dt):
         """Get a new frame from the camera and show it on screen."""
-        ret, frame = self.capture.read()
-
-        if not ret:
+        seq, frame = self.capture.latest()
+        if frame is None or seq == self.last_seq:
             return
+        self.last_seq = seq
         
         # self.current_frame = frame.copy()
 
-        # Convert to Kivy texture
-        buf = cv2.flip(frame, 0).tobytes()
-        texture = Texture.create(size=(frame.shape[1], frame.shape[0]), colorfmt='bgr')
-        texture.blit_buffer(buf, colorfmt='bgr', bufferfmt='ubyte')
-        self.ids.camera_feed.texture = texture
-
-    def capture_face(self, dt=None):
-
-        if self.capture_count >= 20:
+        # Upload into the reused Kivy texture
+        self.display.show(self.ids.camera_feed, frame)
+
+    def enroll_loop(self, capture):
+        """
+        Worker thread: process every new camera frame until enough samples
+        are collected, then hand over to the main thread to save them.
+        """
+        seq = 0
+        while self.is_capturing and not self.samples.full:
+            seq, frame = capture.wait_for(seq, timeout=0.5)
+            if frame is None:
+                if not capture.running:
+                    return
+                continue
+            try:
+                self.capture_face(frame)
+            except Exception as e:
+                print(f"Error capturing face: {e}")
+
+        if self.is_capturing and self.samples.full:
             self.is_capturing = False
-            Clock.unschedule(self.capture_face)
-            self.process_captured_faces()
-            return
-        
-        ret, frame = self.capture.read()
-        if not ret:
-            return
+            Clock.schedule_once(lambda dt: self.process_captured_faces())
 
-        faces = self.image_manager.detect_faces(frame)
+    def capture_face(self, frame):
+        """Detect and embed the face in one frame and keep it if it adds a new pose."""
+        faces = self.image_manager.detect_faces_full(frame)
         current_time = time.time()
+        label = None
 
-        progress = (self.capture_count / 20) * 100
-        self.ids.progress_bar.value = progress # Update the progress bar value
+        reason = self.quality_gate.check(frame, faces[0]) if len(faces) else None
 
-        if faces:
-            x1, y1, x2, y2 = faces[0]
-            face_img = frame[y1:y2, x1:x2]
-            embedding = self.image_manager.extract_features(face_img)
+        if reason is not None:
+            instruction = QUALITY_INSTRUCTIONS[reason]
+            label = instruction
+
+        elif len(faces):
+            # Same landmark alignment as recognition uses
+            embedding = self.image_manager.extract_features_aligned(frame, faces[:1])[0]
 
             instruction = "please look at the camera"
 
-            if self.is_duplicate_embedding(embedding, 0.8):
+            quality = quality_score(frame, faces[0])
+
+            if not self.samples.add(embedding, frame, quality):
                 instruction = "Slowly turn your head left and right." if self.capture_count < 10 else "Gently nod your head up and down."
-                self.ids.label.text = instruction
+                label = instruction
 
-            else:
-                self.captured_features.append(embedding)
-                self.captured_images.append(frame)
-                self.capture_count += 1
+        progress = (self.capture_count / self.samples.capacity) * 100
+        Clock.schedule_once(partial(self.update_progress, progress, label))
 
         if current_time - self.last_speech_time > 8:
-            if faces:
+            if len(faces):
                 self.voice_manager.speak(instruction)
             else:
                 self.voice_manager.no_face_detected()
 
             self.last_speech_time = current_time  
 
-
-
-    def is_duplicate_embedding(self, new_embedding, threshold):
-        """Check if this embedding is similar to an already-captured one."""
-        if not self.captured_features:
-            return False
-
-        similarities = [
-            np.dot(new_embedding, stored) / (np.linalg.norm(new_embedding) * np.linalg.norm(stored))
-            for stored in self.captured_features
-        ]
-
-        return any(sim > threshold for sim in similarities)
+    def update_progress(self, progress, label, *args):
+        """Main thread: show capture progress and the current instruction."""
+        self.ids.progress_bar.value = progress # Update the progress bar value
+        if label:
+            self.ids.label.text = label
 
     def process_captured_faces(self):
-        """Compute average features and save the best image."""
-        avg_features = np.mean(self.captured_features, axis=0).astype(np.float32)
+        """Compute average features, pick prototypes and save the best image."""
+        avg_features = self.samples.mean()
+        prototypes, qualities = self.samples.prototypes(k=5)
 
-        first_face_frame = self.captured_images[0]  # 直接取第一张
-        image_path = self.save_face_image(first_face_frame)  # **保存裁剪后的人脸**
+        best_face_frame = self.samples.best_frame()
+        image_path = self.save_face_image(best_face_frame)  # **保存裁剪后的人脸**
 
         # Insert into database
         name = self.face_info["name"]
         relation = self.face_info["relation"]
-        save_face_data(name, relation, image_path, avg_features)
+        save_face_data(name, relation, image_path, avg_features, prototypes, qualities)
 
         # Switch to success screen
         app = MDApp.get_running_app()
@@ -220,6 +252,7 @@ class AddFaceScreen(Screen):
             print("No face detected, saving full frame!") 
             face_image = frame  
         cv2.imwrite(save_path, face_image)
+        create_thumbnail(save_path, face_image)
         print(f"Face saved at: {save_path}")
         
         return save_path
@@ -7,17 +7,15 @@ to entries in the database.
 from kivy.uix.screenmanager import Screen
 from kivy.clock import Clock
 from kivymd.app import MDApp
-from kivy.graphics.texture import Texture
+from src.ui.display_texture import DisplayTexture
 
-import cv2
-import os
-import numpy as np
-import sqlite3
-from functools import partial
-from src.util.face_manager import get_face, save_recognition
-from src.util.voice_manager import VoiceManager
-from src.util.image_manager import ImageManager
-import threading
+import time
+from src.util.frame_pipeline import FramePipeline
+from src.util.camera_source import CameraSource
+from src.util.face_quality import QualityGate
+from src.util.metrics import metrics
+from src.util.recognition_engine import RecognitionEngine, FaceTracks
+from src.util.registry import get_image_manager, get_voice_manager, get_gallery, get_history_writer
 
 
 
@@ -29,103 +27,165 @@ class ResultScreen(Screen):
 class RecognitionScreen(Screen):
     """
     Captures frames from the camera and performs face recognition
-    at regular intervals. Allows switching between front/rear cameras.
+    whenever a background worker is free. Allows switching between
+    front/rear cameras.
     """
     current_camera = 0  # 0: rear camera, 1: front camera
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.capture = None
-        self.frame_counter = 0
-        self.last_faces = []
-        self.voice_manager = VoiceManager()
-        self.image_manager = ImageManager()
+        self.capture = None  # CameraSource, reads frames on its own thread
+        self.last_seq = 0  # sequence number of the last frame shown
+        self.last_faces = []  # track IDs shown on the label
+        self.tracks = FaceTracks(detect_interval=5)  # face tracks and votes of the camera feed
+        self.tracks_stale = False  # set on the UI thread; the worker resets the tracks
+        self.quality_gate = QualityGate()  # skips faces too poor to embed
+        self.engine = RecognitionEngine(quality_gate=self.quality_gate)
+        self.pipeline = FramePipeline(self.process_face, name="recognition")
+        self.display = DisplayTexture()  # live camera feed
+        self.result_display = DisplayTexture()  # snapshot on the result screen
+        self.overlay_counts = None  # (time, frames, processed) at the last overlay update
+
+    # Shared instances, created on first use (see registry.preload)
+    @property
+    def voice_manager(self):
+        return get_voice_manager()
+
+    @property
+    def image_manager(self):
+        return get_image_manager()
+
+    @property
+    def gallery(self):
+        return get_gallery()
+
+    @property
+    def history_writer(self):
+        return get_history_writer()
 
     def on_enter(self, *args):
-        """Start camera capture and load the face model."""
+        """Start camera capture and the recognition worker."""
+        self.last_faces = []
+        self.tracks_stale = True
+        self.pipeline.start()
         self.start_capture()
+
+        metrics.add_collector("recognition.pipeline", self.pipeline.stats)
+        metrics.add_collector("recognition.quality", self.quality_metrics)
+        if metrics.overlay:
+            self.overlay_counts = None
+            self.ids.metrics_overlay.text = ""
+            Clock.schedule_interval(self.update_overlay, 0.5)
         
 
 
     def start_capture(self):
-        """Open the camera and schedule frame updates."""
-        self.capture = cv2.VideoCapture(self.current_camera)
+        """Start the camera thread and schedule frame updates."""
+        self.capture = CameraSource(self.current_camera).start()
+        self.last_seq = 0
         Clock.schedule_interval(self.update_frame, 1.0 / 30)
 
 
     def update_frame(self, dt):
-        ret, frame = self.capture.read()
-        if not ret:
+        # Never blocks: takes the newest frame the camera thread has read
+        seq, frame = self.capture.latest()
+        if frame is None or seq == self.last_seq:
             return
+        self.last_seq = seq
 
-        if self.frame_counter % 15 == 0:
-            threading.Thread(target=self.process_face, args=(frame,)).start()
-
-        buf = cv2.flip(frame, 0).tobytes()
-        texture = Texture.create(size=(frame.shape[1], frame.shape[0]), colorfmt='bgr')
-        texture.blit_buffer(buf, colorfmt='bgr', bufferfmt='ubyte')
-        self.ids.camera_feed.texture = texture  
+        # The newest frame replaces any frame the worker has not picked up yet
+        self.pipeline.submit(frame)
+        metrics.count("recognition.frames")
 
-        self.frame_counter += 1
+        self.display.show(self.ids.camera_feed, frame)
 
     def process_face(self, frame):
-        """Detect and recognize faces in the given frame."""
-        new_faces = self.image_manager.detect_faces(frame)
-
-        if new_faces and new_faces != self.last_faces:
-            self.last_faces = new_faces
-            x1, y1, x2, y2 = new_faces[0]
-            face_img = frame[y1:y2, x1:x2]
-
-            new_face = self.image_manager.extract_features(face_img)
-            detected_name, confidence_score, relationship = self.find_best_match(new_face)
-
-            # update ui
-            def update_label(*args):
-                self.ids.recognition_label.text = f"{detected_name} ({confidence_score:.2f}%)"
-
-            Clock.schedule_once(update_label)
-
-
+        """
+        Track faces and recognize the ones that need it (see
+        RecognitionEngine.track), then show the results.
+        """
+        # Reset here rather than on the UI thread, which could race with process()
+        if self.tracks_stale:
+            self.tracks_stale = False
+            self.tracks.reset()
+            self.last_faces = []
+        embedded = self.engine.process(self.tracks, frame)
+
+        new_faces = [track.track_id for track in self.tracks.visible]
+        if not new_faces or (not embedded and new_faces == self.last_faces):
+            return
+        self.last_faces = new_faces
+        results = [match for _, match in self.tracks.results()]
+        if not results:
+            return
 
-    def find_best_match(self, new_face, threshold=0.75):
+        # update ui
+        def update_label(*args):
+            self.ids.recognition_label.text = ", ".join(
+                f"{detected_name} ({confidence_score:.2f}%)"
+                for detected_name, confidence_score, _ in results)
+
+        Clock.schedule_once(update_label)
+
+    def quality_metrics(self):
+        """Quality gate counters as flat gauges for the metrics snapshot."""
+        stats = self.quality_gate.stats()
+        gauges = {f"rejected.{reason}": n for reason, n in stats["rejected"].items()}
+        gauges["passed"] = stats["passed"]
+        return gauges
+
+    def update_overlay(self, dt):
+        """Show camera/processing FPS and stage latencies (FACEAPP_METRICS_OVERLAY=1)."""
+        snapshot = metrics.snapshot()
+        counters, histograms = snapshot["counters"], snapshot["histograms"]
+        counts = (time.perf_counter(), counters.get("recognition.frames", 0),
+                  histograms.get("recognition.process", {}).get("count", 0))
+
+        if self.overlay_counts is not None:
+            elapsed = max(counts[0] - self.overlay_counts[0], 1e-6)
+            shown_fps = (counts[1] - self.overlay_counts[1]) / elapsed
+            processed_fps = (counts[2] - self.overlay_counts[2]) / elapsed
+
+            def p50(name):
+                return histograms.get(name, {}).get("p50_ms", 0.0)
+
+            self.ids.metrics_overlay.text = (
+                f"camera {shown_fps:.1f} fps | processed {processed_fps:.1f} fps | "
+                f"detect {p50('detect.invoke'):.0f} ms | embed {p50('embed.invoke'):.0f} ms | "
+                f"match {p50('match.search'):.1f} ms | latency {p50('recognition.latency'):.0f} ms | "
+                f"dropped {counters.get('recognition.dropped', 0)}")
+        self.overlay_counts = counts
+
+    def find_best_match(self, new_face):
         """
         Compare the detected face embedding to stored embeddings.
         Returns the best name match, confidence, and relationship.
         """
-        known_faces = get_face()
-        best_match, best_score, best_relationship = "?", 0, "?"
-
-        for face_id, name, relation, stored_features in known_faces:
-            stored_features = np.frombuffer(stored_features, dtype=np.float32)
-
-            # Cosine similarity
-            score = (np.dot(new_face, stored_features) /
-                     (np.linalg.norm(new_face) * np.linalg.norm(stored_features)))
-
-            if score > best_score:
-                best_match, best_score, best_relationship = name, score, relation
-
-        if best_score > threshold:
-            return best_match, best_score * 100, best_relationship
-        else:
-            return "?", best_score, "?"
+        return self.engine.match(new_face)
 
     def switch_camera(self, *args):
-        """Release the old camera and switch to the other camera."""
-        self.capture.release()
+        """Switch to the other camera; the camera thread reopens the device."""
         self.current_camera = 1 - self.current_camera
-        self.start_capture()
+        self.tracks_stale = True
+        if self.capture:
+            self.capture.switch(self.current_camera)
 
     def on_leave(self, *args):
-        """Release the camera when leaving this screen."""
+        """Release the camera and stop the worker when leaving this screen."""
+        Clock.unschedule(self.update_frame)
+        Clock.unschedule(self.update_overlay)
+        metrics.remove_collector("recognition.pipeline")
+        metrics.remove_collector("recognition.quality")
+        self.pipeline.stop()
         if self.capture:
-            self.capture.release()
+            self.capture.stop()
+            self.capture = None
 
     def open_result_screen(self):
         """
         Take a final frame snapshot and show it on the ResultScreen,
-        along with the recognition outcome.
+        along with the recognition outcome. Uses the voted decision of the
+        face in view when there is one, otherwise matches this frame.
         """
         ret, frame = self.capture.read()
         if not ret:
@@ -134,13 +194,14 @@ class RecognitionScreen(Screen):
         app = MDApp.get_running_app()
         result_screen = app.sm.get_screen("result")
 
-        faces = self.image_manager.detect_faces(frame)
+        decision = self.tracks.current_decision()
+        faces = self.engine.detect(frame) if decision is None else None
 
-        if faces:
-            x1, y1, x2, y2 = faces[0] 
-            face_img = frame[y1:y2, x1:x2]  
-            
-            new_face = self.image_manager.extract_features(face_img) 
+        if decision is not None:
+            detected_name, confidence_score, relationship = decision
+
+        elif len(faces):
+            new_face = self.engine.embed(frame, faces[:1])[0]
 
             detected_name, confidence_score, relationship = self.find_best_match(new_face)
         
@@ -149,10 +210,7 @@ class RecognitionScreen(Screen):
             detected_name, confidence_score, relationship = "?", 0.0, "?"
             return
 
-        buf = cv2.flip(frame, 0).tobytes()
-        texture = Texture.create(size=(frame.shape[1], frame.shape[0]), colorfmt='bgr')
-        texture.blit_buffer(buf, colorfmt='bgr', bufferfmt='ubyte')
-        result_screen.ids.result_image.texture = texture
+        self.result_display.show(result_screen.ids.result_image, frame)
 
         # Update the UI
         if detected_name != "?":
@@ -161,12 +219,8 @@ class RecognitionScreen(Screen):
             result_screen.ids.result_icon.icon = "check-circle"
             result_screen.ids.result_icon.text_color = (0, 0.6, 0.6, 1)
 
-            # save result
-            save_recognition(
-                name=detected_name,
-                relation=relationship,
-                image_path=self.save_face_image(frame),
-                result="Verified")
+            # save result (written in the background)
+            self.engine.log((detected_name, confidence_score, relationship), frame)
             
         else:
             result_screen.ids.result_label.text = f"No Match Found ({confidence_score:.2f}%)"
@@ -174,22 +228,10 @@ class RecognitionScreen(Screen):
             result_screen.ids.result_icon.text_color = (1, 0, 0, 1)
             self.voice_manager.alert_message()
 
-            save_recognition(
-                    name="Unknown",
-                    relation="Stranger",
-                    image_path=self.save_face_image(frame),
-                    result="Failed"
-                )
+            self.engine.log(("?", confidence_score, "?"), frame)
 
         app.sm.current = "result"
         
     def save_face_image(self, image):
-        """Save the full image."""
-        if not os.path.exists("captured_face"): os.makedirs("captured_face")
-
-        existing_files = len(os.listdir("captured_face"))
-        new_id = existing_files + 1
-        save_path = f"captured_face/captured_face_{new_id}.png"
-
-        cv2.imwrite(save_path, image)
-        return save_path
+        """Queue the full image to be saved in the background and return its path."""
+        return self.history_writer.save_image(image)
@@ -0,0 +1,37 @@
+"""
+Reusable texture for showing camera frames in a Kivy Image. One texture
+is kept per frame size, flipped through its UV coordinates and filled
+straight from the frame's buffer.
+"""
+
+import numpy as np
+from kivy.graphics.texture import Texture
+
+
+class DisplayTexture:
+    """One BGR texture, reused while the frame size stays the same."""
+
+    def __init__(self):
+        self.texture = None
+        self.size = None
+
+    def update(self, frame):
+        """Upload a BGR frame and return the (possibly reused) texture."""
+        h, w = frame.shape[:2]
+        if self.texture is None or self.size != (w, h):
+            self.texture = Texture.create(size=(w, h), colorfmt='bgr')
+            self.texture.flip_vertical()  # OpenCV rows go top-down
+            self.size = (w, h)
+
+        if not frame.flags['C_CONTIGUOUS']:
+            frame = np.ascontiguousarray(frame)
+        self.texture.blit_buffer(frame.reshape(-1).data, colorfmt='bgr', bufferfmt='ubyte')
+        return self.texture
+
+    def show(self, image_widget, frame):
+        """Display a frame in an Image widget."""
+        texture = self.update(frame)
+        if image_widget.texture is not texture:
+            image_widget.texture = texture
+        else:
+            image_widget.canvas.ask_update()
@@ -135,11 +135,11 @@ ScreenManager:
                         IconLeftWidget:
                             icon: 'database'
 
-                    # OneLineIconListItem:
-                    #     text: 'Data transfer'
-                    #     # on_release: app.root.current = "transfer"
-                    #     IconLeftWidget:
-                    #         icon: 'cellphone'
+                    OneLineIconListItem:
+                        text: 'Data transfer'
+                        on_release: app.open_transfer()
+                        IconLeftWidget:
+                            icon: 'cellphone'
 
                     OneLineIconListItem:
                         text: 'Dark Mode'
@@ -163,10 +163,34 @@ ScreenManager:
 
             elevation: 1
 
-        ScrollView:
-            MDList:
-                id: history_list
-                    
+        MDLabel:
+            id: history_empty
+            text: ""
+            halign: "center"
+            theme_text_color: "Secondary"
+            size_hint_y: None
+            height: self.texture_size[1] if self.text else 0
+
+        # Rows are recycled and fetched page by page while scrolling
+        RecycleView:
+            id: history_list
+            viewclass: "HistoryListItem"
+            on_scroll_y: app.on_history_scroll(self)
+
+            RecycleBoxLayout:
+                orientation: "vertical"
+                default_size: None, dp(72)
+                default_size_hint: 1, None
+                size_hint_y: None
+                height: self.minimum_height
+
+<HistoryListItem@TwoLineAvatarListItem>:
+    source: ""
+    ImageLeftWidget:
+        source: root.source
+        # Hidden until the thumbnail has been created
+        opacity: 1 if root.source else 0
+
 
 <FaceInfoScreen>:
     name: "face_info"
@@ -302,6 +326,15 @@ ScreenManager:
             allow_stretch: True
             keep_ratio: True 
             size_hint: 1, 1 
+
+        MDLabel:
+            id: metrics_overlay
+            text: ""
+            font_size: "12sp"
+            halign: "left"
+            theme_text_color: "Secondary"
+            size_hint_y: None
+            height: self.texture_size[1] if self.text else 0
         
         MDLabel:
             id: recognition_label
@@ -363,9 +396,36 @@ ScreenManager:
             left_action_items: [["arrow-left", lambda x: app.go_home()]]
             elevation: 1
 
-        ScrollView:
-            MDList:
-                id: faces_list
+        MDLabel:
+            id: faces_empty
+            text: ""
+            halign: "center"
+            theme_text_color: "Secondary"
+            size_hint_y: None
+            height: self.texture_size[1] if self.text else 0
+
+        # Rows are recycled and fetched page by page while scrolling
+        RecycleView:
+            id: faces_list
+            viewclass: "FaceListItem"
+            on_scroll_y: app.on_faces_scroll(self)
+
+            RecycleBoxLayout:
+                orientation: "vertical"
+                default_size: None, dp(72)
+                default_size_hint: 1, None
+                size_hint_y: None
+                height: self.minimum_height
+
+<FaceListItem@TwoLineAvatarIconListItem>:
+    source: ""
+    face_id: 0
+    ImageLeftWidget:
+        source: root.source
+        opacity: 1 if root.source else 0
+    IconRightWidget:
+        icon: "delete"
+        on_release: app.confirm_delete(root.face_id)
 
 <TransferScreen>:
     name: 'transfer'
@@ -376,22 +436,55 @@ ScreenManager:
             left_action_items: [["arrow-left", lambda x: app.go_back()]]
             # elevation: 1
 
-        MDLabel:
-            text: "Data Transfer"
-            halign: "center"
-            font_style: "H5"
+        BoxLayout:
+            orientation: "vertical"
+            padding: dp(20)
+            spacing: dp(15)
 
-        MDRaisedButton:
-            text: "Export Database"
-            icon: "upload"
-            pos_hint: {"center_x": 0.5}
-            # on_release: app.export_database()
+            MDLabel:
+                text: "Import Faces"
+                halign: "center"
+                font_style: "H5"
+                size_hint_y: None
+                height: self.texture_size[1]
 
-        MDRaisedButton:
-            text: "Import Database"
-            icon: "download"
-            pos_hint: {"center_x": 0.5}
-            # on_release: app.import_database()
+            MDLabel:
+                text: "A folder with one subfolder of photos per person, or a CSV file with path, name and relation columns."
+                halign: "center"
+                theme_text_color: "Secondary"
+                font_style: "Caption"
+                size_hint_y: None
+                height: self.texture_size[1]
+
+            MDTextField:
+                id: import_path
+                hint_text: "Folder or CSV file"
+                mode: "rectangle"
+
+            MDRaisedButton:
+                id: import_button
+                text: "Import Faces"
+                icon: "download"
+                pos_hint: {"center_x": 0.5}
+                on_release: app.import_faces(import_path.text)
+
+            MDProgressBar:
+                id: import_progress
+                value: 0
+
+            MDLabel:
+                id: import_status
+                text: ""
+                halign: "center"
+                theme_text_color: "Secondary"
+
+            # MDRaisedButton:
+            #     text: "Export Database"
+            #     icon: "upload"
+            #     pos_hint: {"center_x": 0.5}
+            #     on_release: app.export_database()
+
+            Widget:
 
 <UserScreen>:
     name: "user"
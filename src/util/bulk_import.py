@@ -0,0 +1,277 @@
+"""
+Bulk enrollment from labelled photos.
+
+The input is either a CSV file with the columns `path`, `name` and
+optionally `relation` (paths relative to the CSV file), or a directory
+where every subfolder is one person and holds that person's photos;
+photos directly in the directory are named after their file.
+
+Every person is one task for a process pool. A worker detects the
+largest face in each photo, runs the quality gate, aligns and embeds it,
+and returns the mean embedding, up to five prototypes and the best crop,
+picked the same way as live enrollment (see enrollment). It also writes
+the list thumbnail of that crop. The main process writes the results in
+batches of `batch_size` people, each batch in one transaction.
+
+Every photo is recorded in the 'face_imports' table. Running the same
+import again skips people that were already imported and retries the
+ones that failed, so an interrupted import can simply be restarted.
+Photos that could not be used in the latest run are listed, with the
+reason, in a CSV report.
+
+Usage:
+    python -m src.util.bulk_import staff_photos/ --workers 8 --report failures.csv
+    python -m src.util.bulk_import staff.csv --relation Employee
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import cv2
+import numpy as np
+
+from src.util.enrollment import EnrollmentSamples
+from src.util.face_manager import init_db, save_imported_faces, get_import_status
+from src.util.face_quality import QualityGate, face_crop, quality_score
+from src.util.registry import is_loaded, get_gallery, get_image_manager
+from src.util.thumbnail_cache import write_thumbnail, register_thumbnails
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+ASSETS_DIR = "assets"
+DEFAULT_RELATION = "Imported"
+
+# Models of this process, loaded by the first embed_person call
+_image_manager = None
+_quality_gate = None
+
+
+def read_manifest(path, relation=DEFAULT_RELATION):
+    """
+    List the people to import from a CSV file or a directory.
+    Returns [(name, relation, [absolute photo paths])] in input order.
+    """
+    people = {}
+
+    def add(name, person_relation, photo):
+        people.setdefault((name, person_relation), []).append(os.path.abspath(photo))
+
+    if os.path.isdir(path):
+        for entry in sorted(os.scandir(path), key=lambda e: e.name):
+            if entry.is_dir():
+                for photo in sorted(os.listdir(entry.path)):
+                    if photo.lower().endswith(IMAGE_EXTENSIONS):
+                        add(entry.name, relation, os.path.join(entry.path, photo))
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                add(os.path.splitext(entry.name)[0], relation, entry.path)
+    else:
+        base = os.path.dirname(os.path.abspath(path))
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            missing = {"path", "name"} - set(reader.fieldnames or ())
+            if missing:
+                raise ValueError(f"{path} is missing the column(s): {', '.join(sorted(missing))}")
+            for row in reader:
+                name = (row["name"] or "").strip()
+                photo = (row["path"] or "").strip()
+                if name and photo:
+                    add(name, (row.get("relation") or "").strip() or relation,
+                        os.path.join(base, photo))
+
+    return [(name, person_relation, photos) for (name, person_relation), photos in people.items()]
+
+
+def _load_models():
+    """
+    One single-threaded set of models per worker process. Loaded on the
+    first task rather than in a pool initializer, so a model that fails
+    to load fails the import instead of respawning workers forever.
+    """
+    global _image_manager, _quality_gate
+    if _image_manager is None:
+        from src.util.image_manager import ImageManager
+
+        _image_manager = ImageManager(pool_size=1, num_threads=1)
+        _quality_gate = QualityGate()
+
+
+def embed_person(task, image_manager=None, quality_gate=None):
+    """
+    Embed the photos of one person. Returns a dict with the person's name,
+    relation, image_path, thumbnail digest, features, prototypes and
+    qualities (all None if no photo was usable), the photo paths that were used (`ok`) and
+    (path, reason) pairs for the ones that were not (`failed`).
+    """
+    name, relation, photos = task
+    if image_manager is None:
+        _load_models()
+        image_manager = _image_manager
+    quality_gate = quality_gate or _quality_gate or QualityGate()
+
+    # Near-identical copies of a photo are used but not kept as extra samples
+    samples = EnrollmentSamples(capacity=len(photos), duplicate_threshold=0.99)
+    ok, failed = [], []
+    for photo in photos:
+        try:
+            image = cv2.imread(photo)
+            if image is None:
+                failed.append((photo, "unreadable"))
+                continue
+            faces = image_manager.detect_faces_full(image)
+            if len(faces) == 0:
+                failed.append((photo, "no_face"))
+                continue
+
+            # Use the largest face in a photo that contains several people
+            box = faces['box']
+            face = faces[int(np.argmax((box[:, 2] - box[:, 0]) * (box[:, 3] - box[:, 1])))]
+            reason = quality_gate.check(image, face)
+            if reason is not None:
+                failed.append((photo, reason))
+                continue
+
+            embedding = image_manager.extract_features_aligned(image, face[None])[0]
+            samples.add(embedding, face_crop(image, face['box']), quality_score(image, face))
+            ok.append(photo)
+        except Exception as e:
+            failed.append((photo, f"error: {e}"))
+
+    result = {"name": name, "relation": relation, "image_path": None, "thumbnail": None,
+              "features": None, "prototypes": None, "qualities": None, "ok": ok, "failed": failed}
+    if samples.count == 0:
+        return result
+
+    prototypes, qualities = samples.prototypes(k=5)
+    digest = hashlib.sha1("\n".join(ok).encode()).hexdigest()
+    image_path = os.path.join(ASSETS_DIR, f"import_{digest}.png")
+    os.makedirs(ASSETS_DIR, exist_ok=True)
+    best = samples.best_frame()
+    if cv2.imwrite(image_path, best):
+        # Written here so the faces list doesn't create 50k thumbnails on first view
+        written = write_thumbnail(image_path, best)
+        result["thumbnail"] = written[0] if written else None
+    else:
+        image_path = ""
+
+    result.update(image_path=image_path, features=samples.mean(),
+                  prototypes=prototypes, qualities=qualities)
+    return result
+
+
+def pending_people(people):
+    """Drop the people whose photos were already imported; returns (todo, skipped count)."""
+    status = get_import_status()
+    todo = [person for person in people
+            if not any(status.get(photo) == "ok" for photo in person[2])]
+    return todo, len(people) - len(todo)
+
+
+def import_faces(path, relation=DEFAULT_RELATION, workers=None, batch_size=200,
+                 report_path=None, on_progress=None):
+    """
+    Import every person listed in `path` (a CSV file or a directory).
+    `workers` is the number of processes (default: one per CPU; 0 runs
+    in this process). on_progress(done, total) is called after every
+    person. Returns a summary dict.
+    """
+    init_db()
+    started = time.perf_counter()
+    people, skipped = pending_people(read_manifest(path, relation))
+    total = len(people)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    summary = {"people": total, "skipped": skipped, "imported": 0, "failed_people": 0,
+               "photos_ok": 0, "photos_failed": 0}
+    report = []
+    faces, failures, thumbnails = [], [], []
+
+    def flush():
+        save_imported_faces(faces, failures, notify=False)
+        register_thumbnails(thumbnails)
+        faces.clear()
+        failures.clear()
+        thumbnails.clear()
+
+    pool = None
+    if workers and total:
+        pool = Pool(min(workers, total))
+        results = pool.imap_unordered(embed_person, people, chunksize=4)
+    else:
+        image_manager = get_image_manager()
+        results = (embed_person(person, image_manager) for person in people)
+
+    try:
+        for done, result in enumerate(results, 1):
+            failures.extend(result["failed"])
+            report.extend((result["name"], photo, reason) for photo, reason in result["failed"])
+            summary["photos_ok"] += len(result["ok"])
+            summary["photos_failed"] += len(result["failed"])
+            if result["features"] is None:
+                summary["failed_people"] += 1
+            else:
+                summary["imported"] += 1
+                faces.append((result["name"], result["relation"], result["image_path"],
+                              result["features"], result["prototypes"], result["qualities"],
+                              result["ok"]))
+                if result["thumbnail"]:
+                    thumbnails.append((result["image_path"], result["thumbnail"]))
+
+            if len(faces) >= batch_size:
+                flush()
+            if on_progress:
+                on_progress(done, total)
+        flush()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    # The listeners were not notified per face; bring the shared gallery up to date at once
+    if summary["imported"] and is_loaded("gallery"):
+        get_gallery().load()
+
+    # The report only covers this run; an old one would list photos that have since been imported
+    if report_path and report:
+        with open(report_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "path", "reason"])
+            writer.writerows(report)
+        summary["report"] = report_path
+    elif report_path and os.path.exists(report_path):
+        os.remove(report_path)
+
+    summary["seconds"] = round(time.perf_counter() - started, 1)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="CSV file (path,name[,relation]) or directory of labelled photos")
+    parser.add_argument("--relation", default=DEFAULT_RELATION, help="relation for people without one")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: one per CPU, 0: no pool)")
+    parser.add_argument("--batch-size", type=int, default=200, help="people written per transaction")
+    parser.add_argument("--report", help="write the photos that could not be used to this CSV file")
+    parser.add_argument("--progress", action="store_true",
+                        help="print one JSON progress line per person (for the app)")
+    args = parser.parse_args()
+
+    def progress(done, total):
+        if args.progress:
+            print(json.dumps({"done": done, "total": total}), flush=True)
+        elif done % 100 == 0 or done == total:
+            print(f"{done}/{total}", file=sys.stderr, flush=True)
+
+    summary = import_faces(args.path, args.relation, args.workers, args.batch_size,
+                           args.report, on_progress=progress)
+    print(json.dumps(summary), flush=True)
+
+
+if __name__ == "__main__":
+    main()
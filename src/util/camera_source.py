@@ -0,0 +1,204 @@
+"""
+Frame sources that capture on their own thread. CameraSource reads a
+camera device and FileSource plays back a video file or a directory of
+images; consumers take the newest frame without blocking.
+"""
+
+import glob
+import os
+import threading
+import time
+import cv2
+
+from src.util.metrics import metrics
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FrameSource:
+    """
+    Base class: a capture thread calling _grab() and a single-slot buffer.
+    Each stored frame is a fresh array, so consumers may keep it.
+    """
+
+    def __init__(self, name="frame-source"):
+        self.name = name
+        self.condition = threading.Condition()
+        self.frame = None
+        self.seq = 0  # increases by one for every captured frame
+        self.timestamp = 0.0
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+        self.thread = None
+
+    def latest(self):
+        """Return (seq, frame) of the newest frame without waiting; frame may be None."""
+        with self.condition:
+            return self.seq, self.frame
+
+    def read(self):
+        """cv2.VideoCapture-style (ret, frame) of the newest frame."""
+        _, frame = self.latest()
+        return frame is not None, frame
+
+    def wait_for(self, after_seq=0, timeout=None):
+        """Wait for a frame newer than after_seq; returns (seq, frame) or (seq, None) on timeout."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq > after_seq or not self.running, timeout)
+            if self.seq > after_seq:
+                return self.seq, self.frame
+            return self.seq, None
+
+    def _publish(self, frame):
+        with self.condition:
+            self.frame = frame
+            self.seq += 1
+            self.timestamp = time.monotonic()
+            self.condition.notify_all()
+
+    def _run(self):
+        try:
+            self._open()
+            while self.running:
+                start = metrics.clock()
+                frame = self._grab()
+                if frame is None:
+                    time.sleep(0.01)
+                    continue
+                metrics.since("camera.read", start)
+                self._publish(frame)
+        except Exception as e:
+            print(f"Error in {self.name}: {e}")
+        finally:
+            self._close()
+            self.running = False
+            with self.condition:
+                self.condition.notify_all()
+
+    # Overridden by subclasses; all run on the capture thread.
+    def _open(self):
+        pass
+
+    def _grab(self):
+        return None
+
+    def _close(self):
+        pass
+
+
+class CameraSource(FrameSource):
+    """A camera device read continuously on its own thread."""
+
+    def __init__(self, device=0):
+        super().__init__(name=f"camera-{device}")
+        self.device = device
+        self.pending_device = None
+        self.capture = None
+
+    def switch(self, device):
+        """Switch to another camera; the capture thread reopens it."""
+        self.pending_device = device
+
+    def _open(self):
+        self.capture = cv2.VideoCapture(self.device)
+
+    def _grab(self):
+        if self.pending_device is not None:
+            self._close()
+            self.device, self.pending_device = self.pending_device, None
+            self._open()
+
+        ret, frame = self.capture.read()
+        return frame if ret else None
+
+    def _close(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+class FileSource(FrameSource):
+    """
+    Plays back a video file or a directory of images. With `fps` set,
+    frames are paced like a live camera; otherwise they are produced as
+    fast as they can be decoded. With `loop` playback restarts at the end.
+    """
+
+    def __init__(self, path, fps=None, loop=True):
+        super().__init__(name=f"file-{os.path.basename(os.path.normpath(path))}")
+        self.path = path
+        self.fps = fps
+        self.loop = loop
+        self.capture = None
+        self.images = None
+        self.position = 0
+        self.next_time = 0.0
+        self.finished = False
+
+    def _open(self):
+        if os.path.isdir(self.path):
+            self.images = sorted(p for p in glob.glob(os.path.join(self.path, "*"))
+                                 if p.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            self.capture = cv2.VideoCapture(self.path)
+        self.position = 0
+        self.next_time = time.monotonic()
+
+    def _grab(self):
+        if self.fps:
+            delay = self.next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_time = max(self.next_time + 1.0 / self.fps, time.monotonic() - 1.0)
+
+        frame = self._next_frame()
+        if frame is None and self.loop and self.position > 0:
+            self._close()
+            self._open()
+            frame = self._next_frame()
+        if frame is None:
+            self.finished = True
+            self.running = False
+        return frame
+
+    def _next_frame(self):
+        if self.images is not None:
+            while self.position < len(self.images):
+                frame = cv2.imread(self.images[self.position])
+                self.position += 1
+                if frame is not None:
+                    return frame
+            return None
+
+        ret, frame = self.capture.read()
+        if not ret:
+            return None
+        self.position += 1
+        return frame
+
+    def _close(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+def open_source(spec, **kwargs):
+    """Create a source from a camera index (int or digit string) or a file/directory path."""
+    if isinstance(spec, int) or str(spec).isdigit():
+        return CameraSource(int(spec))
+    return FileSource(spec, **kwargs)
@@ -0,0 +1,79 @@
+"""
+SQLite connections for face_manager: one long-lived connection per
+thread and database file, in WAL mode, closed when the thread ends.
+"""
+
+import atexit
+import sqlite3
+import threading
+import weakref
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # readers don't block the writer
+    "PRAGMA synchronous=NORMAL",  # fsync at checkpoints, not every commit
+    "PRAGMA cache_size=-8000",  # 8 MB page cache
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+_local = threading.local()
+_all_threads = weakref.WeakSet()
+_lock = threading.Lock()
+
+
+class _ThreadConnections:
+    """
+    The connections of one thread, by path. Only the thread-local holds
+    it, so when the thread ends it is freed and its connections closed.
+    """
+
+    def __init__(self):
+        self.connections = {}
+
+
+def _thread_connections():
+    holder = getattr(_local, "holder", None)
+    if holder is None:
+        holder = _local.holder = _ThreadConnections()
+        with _lock:
+            _all_threads.add(holder)
+    return holder.connections
+
+
+def get_connection(path):
+    """Return this thread's connection to `path`, opening it on first use."""
+    connections = _thread_connections()
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=5.0, cached_statements=256)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        connections[path] = conn
+    return conn
+
+
+def close_connection(path=None):
+    """Close this thread's connection(s); the next query reopens them."""
+    connections = _thread_connections()
+    paths = [path] if path is not None else list(connections)
+    for p in paths:
+        conn = connections.pop(p, None)
+        if conn is not None:
+            conn.close()
+
+
+@atexit.register
+def close_all():
+    """
+    Close the connections still open at exit. sqlite3 only lets a
+    connection be closed by the thread that opened it; those of threads
+    that are still running are left to the process exit.
+    """
+    with _lock:
+        holders = list(_all_threads)
+    for holder in holders:
+        for conn in list(holder.connections.values()):
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
@@ -0,0 +1,98 @@
+"""
+Sample collection for enrolling a new face.
+
+Enrollment keeps a fixed number of captured embeddings and rejects new
+ones that are too close to a sample it already has, so the stored
+samples cover different poses. The samples live L2-normalised in a
+preallocated matrix: the duplicate check is one matrix-vector product
+over the rows filled so far instead of a Python loop recomputing norms.
+
+Each sample carries a quality score (see face_quality). When enrollment
+finishes, a few prototypes are picked that are both good quality and
+different from each other, and the best-quality frame is kept as the
+face's image.
+"""
+
+import numpy as np
+
+from src.util.face_gallery import normalize
+
+
+class EnrollmentSamples:
+    """Up to `capacity` normalised embeddings with the frames they came from."""
+
+    def __init__(self, capacity=20, duplicate_threshold=0.8):
+        self.capacity = capacity
+        self.duplicate_threshold = duplicate_threshold  # cosine similarity
+        self.matrix = None  # (capacity, dim), allocated on the first sample
+        self.qualities = np.zeros(capacity, dtype=np.float32)
+        self.frames = []
+        self.count = 0
+
+    def reset(self):
+        self.frames = []
+        self.count = 0
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    @property
+    def embeddings(self):
+        """The normalised embeddings captured so far, (count, dim)."""
+        if self.matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self.matrix[:self.count]
+
+    def is_duplicate(self, embedding):
+        """True if the embedding is too similar to an already captured one."""
+        if self.count == 0:
+            return False
+        similarities = self.embeddings @ normalize(embedding)
+        return bool(similarities.max() > self.duplicate_threshold)
+
+    def add(self, embedding, frame, quality=1.0):
+        """
+        Keep the sample unless it duplicates an earlier one or the set is
+        full. Returns True if it was added.
+        """
+        embedding = normalize(np.ravel(embedding))
+        if self.full or self.is_duplicate(embedding):
+            return False
+        if self.matrix is None or self.matrix.shape[1] != embedding.shape[0]:
+            self.matrix = np.empty((self.capacity, embedding.shape[0]), dtype=np.float32)
+        self.matrix[self.count] = embedding
+        self.qualities[self.count] = quality
+        self.frames.append(frame)
+        self.count += 1
+        return True
+
+    def mean(self):
+        """Average of the captured embeddings, for storing as one row."""
+        return self.embeddings.mean(axis=0).astype(np.float32)
+
+    def best_frame(self):
+        """The frame of the highest-quality sample."""
+        return self.frames[int(np.argmax(self.qualities[:self.count]))]
+
+    def prototypes(self, k=5):
+        """
+        Pick up to k samples to store as prototypes: start from the best
+        quality sample, then repeatedly take the one that scores highest on
+        quality times distance to the prototypes chosen so far.
+        Returns (embeddings, qualities).
+        """
+        embeddings = self.embeddings
+        qualities = self.qualities[:self.count]
+        if self.count == 0:
+            return embeddings, qualities
+
+        chosen = [int(np.argmax(qualities))]
+        closest = embeddings @ embeddings[chosen[0]]  # similarity to the nearest prototype
+        while len(chosen) < min(k, self.count):
+            gain = np.maximum(qualities, 1e-3) * (1.0 - closest)
+            gain[chosen] = -np.inf
+            best = int(np.argmax(gain))
+            chosen.append(best)
+            closest = np.maximum(closest, embeddings @ embeddings[best])
+        return embeddings[chosen].copy(), qualities[chosen].copy()
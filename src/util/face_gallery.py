@@ -0,0 +1,268 @@
+"""
+In-memory gallery of stored face embeddings.
+
+All embeddings are kept L2-normalised in one contiguous float32 matrix, so
+matching a new face is a single matrix-vector product followed by an
+argmax (or a partial sort for top-k) instead of a Python loop over rows.
+The gallery subscribes to face_manager and refreshes itself whenever a
+face is saved, updated or deleted. The search itself is delegated to a
+pluggable index (see face_index), exact by default.
+
+Faces enrolled with several prototype embeddings (one per pose) also get
+a (slots, D) block in a second buffer. A face's score is then the max
+over its slots, computed for every face in one batched product.
+
+With `quantized` the embeddings are held as int8 with one scale per
+vector (see quantization.Int8Matrix), a quarter of the float32 memory.
+"""
+
+import threading
+import numpy as np
+
+from src.util.face_manager import (get_face, get_face_by_id, get_prototypes,
+                                   add_face_listener, remove_face_listener)
+from src.util.face_index import FlatIndex, top_k
+from src.util.quantization import Int8Matrix, blob_encoding, decode_blob
+from src.util.metrics import metrics
+
+PROTOTYPE_SLOTS = 6  # the face's stored embedding plus up to five prototypes
+
+
+def normalize(vectors):
+    """Return float32 copies of the given vectors scaled to unit length."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def decode_features(blob):
+    """
+    Turn a stored 'features' BLOB back into an embedding. Rows saved while
+    extract_features duplicated the face across a batch of two hold the
+    same embedding twice; only one copy is kept.
+    """
+    if blob_encoding(blob) != "float32":
+        return decode_blob(blob)
+    features = np.frombuffer(blob, dtype=np.float32)
+    half = features.shape[0] // 2
+    if features.shape[0] % 2 == 0 and np.allclose(features[:half], features[half:]):
+        return features[:half]
+    return features
+
+
+class FaceGallery:
+    """
+    Holds (id, name, relation) labels and a normalised embedding matrix
+    for every row of the 'faces' table.
+    """
+
+    def __init__(self, index=None, auto_update=True, full_scan_limit=20000, quantized=False):
+        self.lock = threading.RLock()
+        self.auto_update = auto_update
+        self.quantized = quantized  # keep embeddings as int8 instead of float32
+        self.index = index if index is not None else FlatIndex()
+        # Above this many faces, prototypes are only scored for a shortlist
+        # taken from the index.
+        self.full_scan_limit = full_scan_limit
+
+        self._matrix = np.empty((0, 0), dtype=np.float32)  # capacity-sized buffer
+        self._prototypes = None  # (capacity, PROTOTYPE_SLOTS, D), once any face has prototypes
+        self.size = 0  # number of rows in use
+        self.ids = []
+        self.names = []
+        self.relations = []
+        self.row_of = {}  # face id -> row in the matrix
+
+        self.load()
+        if auto_update:
+            add_face_listener(self.refresh_face)
+
+    def close(self):
+        """Stop listening for database changes and persist the index."""
+        if self.auto_update:
+            remove_face_listener(self.refresh_face)
+        with self.lock:
+            self.index.save()
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def dim(self):
+        return self._matrix.shape[1]
+
+    @property
+    def matrix(self):
+        """Normalised embeddings of the rows in use, shape (N, D)."""
+        return self._matrix[:self.size]
+
+    def _allocate(self, shape):
+        """An uninitialised embedding buffer in the gallery's storage format."""
+        if self.quantized:
+            return Int8Matrix.empty(shape)
+        return np.empty(shape, dtype=np.float32)
+
+    def load(self):
+        """(Re)build the gallery from every row in the database."""
+        rows = get_face()
+        prototypes = {}
+        for face_id, blob in get_prototypes():
+            prototypes.setdefault(face_id, []).append(decode_features(blob))
+
+        with self.lock:
+            self.ids = [face_id for face_id, _, _, _ in rows]
+            self.names = [name for _, name, _, _ in rows]
+            self.relations = [relation for _, _, relation, _ in rows]
+            self.row_of = {face_id: i for i, face_id in enumerate(self.ids)}
+            self.size = len(rows)
+
+            if rows:
+                vectors = normalize(np.vstack([decode_features(blob) for _, _, _, blob in rows]))
+                self._matrix = self._allocate(vectors.shape)
+                self._matrix[:] = vectors
+            else:
+                vectors = None
+                self._matrix = np.empty((0, 0), dtype=np.float32)
+
+            self._prototypes = None
+            if rows and prototypes:
+                self._prototypes = self._allocate((self.size, PROTOTYPE_SLOTS, self.dim))
+                for row, face_id in enumerate(self.ids):
+                    self._prototypes[row] = self._slots(vectors[row], prototypes.get(face_id, ()))
+
+            self.index.attach(self.ids, self.matrix)
+
+    @staticmethod
+    def _slots(vector, prototypes):
+        """A face's prototype block: its embedding, then its prototypes, padded with the embedding."""
+        block = np.empty((PROTOTYPE_SLOTS, vector.shape[0]), dtype=np.float32)
+        block[:] = vector
+        prototypes = [p for p in prototypes if p.shape == vector.shape][:PROTOTYPE_SLOTS - 1]
+        if prototypes:
+            block[1:1 + len(prototypes)] = normalize(np.vstack(prototypes))
+        return block
+
+    def refresh_face(self, face_id):
+        """Bring one face in sync with the database after it changed."""
+        face = get_face_by_id(face_id)
+        with self.lock:
+            if face is None:
+                self._remove(face_id)
+            else:
+                features = decode_features(face['features'])
+                prototypes = [decode_features(blob) for _, blob in get_prototypes(face_id)]
+                self._upsert(face_id, face['name'], face['relation'], features, prototypes)
+
+    def _upsert(self, face_id, name, relation, features, prototypes=()):
+        vector = normalize(features)
+        if self.size == 0 or self.dim != vector.shape[0]:
+            if self.size:
+                # Embedding size changed (e.g. a different model); start over.
+                self.load()
+                return
+            self._matrix = self._allocate((4, vector.shape[0]))
+            self._prototypes = None
+
+        row = self.row_of.get(face_id)
+        if row is None:
+            if self.size == self._matrix.shape[0]:
+                grown = self._allocate((self.size * 2, self.dim))
+                grown[:self.size] = self._matrix[:self.size]
+                self._matrix = grown
+                if self._prototypes is not None:
+                    grown = self._allocate((self.size * 2, PROTOTYPE_SLOTS, self.dim))
+                    grown[:self.size] = self._prototypes[:self.size]
+                    self._prototypes = grown
+            row = self.size
+            self.size += 1
+            self.ids.append(face_id)
+            self.names.append(name)
+            self.relations.append(relation)
+            self.row_of[face_id] = row
+        else:
+            self.names[row] = name
+            self.relations[row] = relation
+
+        self._matrix[row] = vector
+        if len(prototypes) and self._prototypes is None:
+            # First face with prototypes: every other face gets its embedding in all slots
+            self._prototypes = self._allocate((self._matrix.shape[0], PROTOTYPE_SLOTS, self.dim))
+            for slot in range(PROTOTYPE_SLOTS):
+                self._prototypes[:, slot] = self._matrix
+        if self._prototypes is not None:
+            self._prototypes[row] = self._slots(vector, prototypes)
+        self.index.set_row(row, vector, face_id)
+
+    def _remove(self, face_id):
+        row = self.row_of.pop(face_id, None)
+        if row is None:
+            return
+
+        # Move the last row into the hole so the matrix stays contiguous.
+        last = self.size - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            if self._prototypes is not None:
+                self._prototypes[row] = self._prototypes[last]
+            self.ids[row] = self.ids[last]
+            self.names[row] = self.names[last]
+            self.relations[row] = self.relations[last]
+            self.row_of[self.ids[row]] = row
+            self.index.move_row(last, row)
+
+        self.index.pop_row()
+        self.ids.pop()
+        self.names.pop()
+        self.relations.pop()
+        self.size = last
+
+    def scores(self, embedding):
+        """
+        Cosine similarity between one embedding and every stored face
+        (the best over its prototypes, if it has any).
+        """
+        query = normalize(np.ravel(embedding))
+        with self.lock:
+            if self.size == 0:
+                return np.empty(0, dtype=np.float32)
+            if self._prototypes is not None:
+                return (self._prototypes[:self.size] @ query).max(axis=1)
+            return self.matrix @ query
+
+    def _search_prototypes(self, query, k):
+        """Return (rows, scores) of the k best faces by their best prototype."""
+        if self.size <= self.full_scan_limit:
+            scores = (self._prototypes[:self.size] @ query).max(axis=1)
+            rows = top_k(scores, k)
+            return rows, scores[rows]
+
+        # Large gallery: re-score a shortlist found by the index
+        candidates, _ = self.index.search(self.matrix, query, max(k, 64))
+        scores = (self._prototypes[candidates] @ query).max(axis=1)
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+    def search(self, embedding, k=1):
+        """
+        Return up to k matches as (face_id, name, relation, score) tuples,
+        best first.
+        """
+        start = metrics.clock()
+        query = normalize(np.ravel(embedding))
+        with self.lock:
+            if self.size == 0:
+                return []
+
+            if self._prototypes is not None:
+                rows, scores = self._search_prototypes(query, k)
+            else:
+                rows, scores = self.index.search(self.matrix, query, k)
+            metrics.since("match.search", start)
+            return [(self.ids[row], self.names[row], self.relations[row], float(score))
+                    for row, score in zip(rows, scores)]
+
+    def best_match(self, embedding):
+        """Return the single closest (face_id, name, relation, score), or None."""
+        matches = self.search(embedding, k=1)
+        return matches[0] if matches else None
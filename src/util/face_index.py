@@ -0,0 +1,334 @@
+"""
+Search backends for FaceGallery.
+
+FlatIndex scores every stored embedding (exact search) and is the
+default: a matrix-vector product over 100k faces takes a few
+milliseconds, and it never misses anyone.
+
+IVFIndex is an inverted-file index written in NumPy: embeddings are
+grouped around k-means centroids and a query only scores the rows in its
+closest groups. It trades recall for latency and is opt-in with
+FACEAPP_INDEX=ivf, for galleries of several hundred thousand faces. The
+IVF centroids and group assignments are saved next to the database so
+they don't have to be retrained at startup.
+"""
+
+import math
+import os
+import threading
+import numpy as np
+
+from src.util.face_manager import DB_PATH
+
+INDEX_PATH = os.path.join(os.path.dirname(DB_PATH), "face_index.npz")
+
+# "flat" (exact search) or "ivf", see create_index
+INDEX_BACKEND = os.environ.get("FACEAPP_INDEX", "flat")
+
+
+def top_k(scores, k):
+    """Return the positions of the k highest scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k == 1:
+        return np.array([int(np.argmax(scores))])
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def exact_search(matrix, query, k=1):
+    """Return (rows, scores) of the k best matches by scoring every row."""
+    scores = matrix @ query
+    rows = top_k(scores, k)
+    return rows, scores[rows]
+
+
+class FlatIndex:
+    """Exact search: one matrix-vector product over the whole gallery."""
+
+    def attach(self, ids, matrix):
+        pass
+
+    def set_row(self, row, vector, face_id=None):
+        pass
+
+    def move_row(self, src, dst):
+        pass
+
+    def pop_row(self):
+        pass
+
+    def save(self):
+        pass
+
+    def search(self, matrix, query, k=1):
+        """Return (rows, scores) of the k best matches for a normalised query."""
+        return exact_search(matrix, query, k)
+
+
+class IVFIndex:
+    """
+    Inverted-file (IVF-flat) index over normalised embeddings.
+
+    The number of closest clusters scanned for each query is the
+    recall/latency knob: `nprobe` if given, otherwise `probe_fraction` of
+    the clusters. The default fraction of 0.3 keeps recall@1 at about
+    0.99 on benchmarks.index_recall at 100k-200k faces (isotropic
+    synthetic embeddings, the worst case for clustering). Galleries
+    smaller than `min_train_size` are searched exactly, and the index is
+    retrained once the gallery has grown `retrain_growth` times past the
+    size it was trained on. With `background`, training runs on its own
+    thread and queries are answered by exact search until it is done.
+    """
+
+    def __init__(self, nlist=None, nprobe=None, probe_fraction=0.3, min_train_size=200000,
+                 retrain_growth=2.0, index_path=INDEX_PATH, n_iter=10, seed=0, background=True):
+        self.nlist = nlist  # None: about sqrt(N) clusters, chosen at training time
+        self.nprobe = nprobe
+        self.probe_fraction = probe_fraction
+        self.min_train_size = min_train_size
+        self.retrain_growth = retrain_growth
+        self.index_path = index_path
+        self.n_iter = n_iter
+        self.seed = seed
+        self.background = background
+
+        self.centroids = None  # (nlist, D), normalised
+        self.trained_size = 0  # gallery size the centroids were trained on
+        self._assign = np.empty(0, dtype=np.int32)  # row -> cluster, with spare capacity
+        self.ids = []  # face id of every row, used to persist assignments
+        self._order = None  # rows sorted by cluster
+        self._bounds = None  # start of each cluster inside _order
+
+        self._training = None  # background training thread
+        self._trained = None  # (generation, centroids, assignments, rows) it produced
+        self._generation = 0  # bumped by attach so an older training run is ignored
+        self._dirty = set()  # rows written while training ran, assigned again afterwards
+        self._train_failed = False
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    @property
+    def assign(self):
+        return self._assign[:len(self.ids)]
+
+    def attach(self, ids, matrix):
+        """Take over a freshly loaded gallery, reusing saved clusters if possible."""
+        self.ids = list(ids)
+        self._assign = np.zeros(len(self.ids), dtype=np.int32)
+        self.centroids = None
+        self._order = None
+        self._generation += 1
+        self._training = None
+        self._trained = None
+
+        if self.load(matrix) and not self._outgrown(len(self.ids)):
+            return
+        self.centroids = None
+        if len(self.ids) >= self.min_train_size:
+            self._start_training(matrix)
+
+    def _outgrown(self, n):
+        return self.is_trained and n >= self.retrain_growth * max(self.trained_size, 1)
+
+    @property
+    def probes(self):
+        """Clusters scanned per query."""
+        if self.nprobe:
+            return self.nprobe
+        return max(1, math.ceil(self.probe_fraction * self.centroids.shape[0]))
+
+    def train(self, matrix):
+        """Run spherical k-means on the gallery and assign every row to a cluster."""
+        centroids, assign = self._fit(matrix)
+        self.centroids = centroids
+        self._assign = assign
+        self.trained_size = matrix.shape[0]
+        self._order = None
+
+    def _fit(self, matrix):
+        """Return (centroids, cluster of every row) for a gallery matrix."""
+        n = matrix.shape[0]
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(self.seed)
+
+        # Train on a sample; every row is assigned afterwards.
+        sample_size = min(n, nlist * 64)
+        sample = np.asarray(matrix[rng.choice(n, sample_size, replace=False)], dtype=np.float32)
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.n_iter):
+            labels = self._nearest(centroids, sample)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Re-seed empty clusters from random sample rows.
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = sums / norms
+
+        centroids = centroids.astype(np.float32)
+        return centroids, self._nearest(centroids, matrix)
+
+    def _start_training(self, matrix):
+        """Train on the first matrix.shape[0] rows, on a thread if `background`."""
+        if self._training is not None or self._train_failed:
+            return
+        self._dirty = set()
+        args = (self._generation, matrix[:matrix.shape[0]], list(self.ids))
+        if not self.background:
+            self._train_worker(*args)
+            self._finish_training(matrix)
+            return
+        self._training = threading.Thread(target=self._train_worker, args=args,
+                                          name="ivf-train", daemon=True)
+        self._training.start()
+
+    def _train_worker(self, generation, matrix, ids):
+        try:
+            centroids, assign = self._fit(matrix)
+        except Exception as e:
+            print(f"Error training face index: {e}")
+            self._train_failed = True
+            self._trained = (generation, None, None, 0)
+            return
+        # Saved from here so the query that picks the result up doesn't write to disk
+        self._save(centroids, ids, assign, len(ids))
+        self._trained = (generation, centroids, assign, len(ids))
+
+    def _finish_training(self, matrix):
+        """Switch to the clusters of a finished training run (called under the gallery's lock)."""
+        trained, self._trained = self._trained, None
+        self._training = None
+        generation, centroids, assign, n = trained
+        if generation != self._generation or centroids is None:
+            return
+
+        size = len(self.ids)
+        self._assign = np.resize(assign, max(size, assign.shape[0]))
+        # Rows added or changed since the snapshot was taken
+        stale = np.array(sorted(row for row in self._dirty if row < size), dtype=np.int64)
+        stale = np.union1d(stale, np.arange(n, size))
+        if stale.size:
+            self._assign[stale] = self._nearest(centroids, matrix[stale])
+        self._dirty = set()
+        self.centroids = centroids
+        self.trained_size = n
+        self._order = None
+
+    @staticmethod
+    def _nearest(centroids, vectors, chunk=8192):
+        labels = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], chunk):
+            block = vectors[start:start + chunk] @ centroids.T
+            labels[start:start + chunk] = np.argmax(block, axis=1)
+        return labels
+
+    def set_row(self, row, vector, face_id=None):
+        if row == len(self.ids):
+            if row == self._assign.shape[0]:
+                # Grow geometrically instead of copying the array for every new row
+                grown = np.zeros(max(16, 2 * row), dtype=np.int32)
+                grown[:row] = self._assign[:row]
+                self._assign = grown
+            self.ids.append(face_id)
+        elif face_id is not None:
+            self.ids[row] = face_id
+        if self.is_trained:
+            self._assign[row] = int(np.argmax(self.centroids @ vector))
+        if self._training is not None:
+            self._dirty.add(row)
+        self._order = None
+
+    def move_row(self, src, dst):
+        self.ids[dst] = self.ids[src]
+        self._assign[dst] = self._assign[src]
+        if self._training is not None:
+            self._dirty.add(dst)
+        self._order = None
+
+    def pop_row(self):
+        self.ids.pop()
+        self._order = None
+
+    def _build_lists(self):
+        assign = self.assign
+        self._order = np.argsort(assign, kind="stable")
+        self._bounds = np.searchsorted(assign[self._order],
+                                       np.arange(self.centroids.shape[0] + 1))
+
+    def search(self, matrix, query, k=1):
+        """Return (rows, scores) of the k best matches for a normalised query."""
+        n = matrix.shape[0]
+        if self._trained is not None:
+            self._finish_training(matrix)
+        if self._training is None and (
+                (not self.is_trained and n >= self.min_train_size) or self._outgrown(n)):
+            self._start_training(matrix)
+        if (self._training is not None or not self.is_trained or n < self.min_train_size
+                or len(self.ids) != n):
+            return exact_search(matrix, query, k)
+
+        if self._order is None:
+            self._build_lists()
+
+        probe = top_k(self.centroids @ query, self.probes)
+        rows = np.concatenate([self._order[self._bounds[c]:self._bounds[c + 1]] for c in probe])
+        if rows.size == 0:
+            return exact_search(matrix, query, k)
+
+        scores = matrix[rows] @ query
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+    def save(self):
+        """Persist centroids and cluster assignments next to the database."""
+        if self.is_trained:
+            self._save(self.centroids, self.ids, self.assign, self.trained_size)
+
+    def _save(self, centroids, ids, assign, trained_size):
+        if not self.index_path:
+            return
+        try:
+            np.savez(self.index_path, centroids=centroids,
+                     ids=np.asarray(ids, dtype=np.int64), assign=assign,
+                     trained_size=np.int64(trained_size))
+        except OSError as e:
+            print(f"Error saving face index: {e}")
+
+    def load(self, matrix):
+        """Restore saved clusters; rows that were not saved are assigned now."""
+        if not self.index_path or not os.path.exists(self.index_path):
+            return False
+        try:
+            data = np.load(self.index_path)
+            centroids, saved_ids, saved_assign = data["centroids"], data["ids"], data["assign"]
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Error loading face index: {e}")
+            return False
+
+        if len(self.ids) == 0 or centroids.shape[1] != matrix.shape[1]:
+            return False
+
+        saved = dict(zip(saved_ids.tolist(), saved_assign.tolist()))
+        self.centroids = centroids.astype(np.float32)
+        self.trained_size = int(data["trained_size"]) if "trained_size" in data else len(saved_ids)
+        self._assign = np.array([saved.get(face_id, -1) for face_id in self.ids], dtype=np.int32)
+
+        missing = np.flatnonzero(self._assign < 0)
+        if missing.size:
+            self._assign[missing] = self._nearest(self.centroids, matrix[missing])
+        self._order = None
+        return True
+
+
+def create_index(backend=INDEX_BACKEND):
+    """The gallery index selected by FACEAPP_INDEX ("flat" unless set)."""
+    if backend == "ivf":
+        return IVFIndex()
+    return FlatIndex()
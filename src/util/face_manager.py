@@ -3,17 +3,52 @@ Database-related functions, including creating tables, saving face data,
 listing all stored faces, and deleting or updating face records.
 """
 
-import sqlite3
 import numpy as np
 import os
 import time
 import shutil
 
+from src.util.db import get_connection
+from src.util.quantization import ENCODINGS, encode_features
+from src.util.metrics import metrics
+
 DB_PATH = "database.db"
 
+# How new embeddings are stored: "float32", "float16" or "int8" (see quantization).
+# Set FACEAPP_FEATURE_ENCODING to the encoding the stored rows were migrated to.
+FEATURE_ENCODING = os.environ.get("FACEAPP_FEATURE_ENCODING", "float32")
+if FEATURE_ENCODING not in ENCODINGS:
+    raise ValueError(f"FACEAPP_FEATURE_ENCODING must be one of {', '.join(ENCODINGS)}, "
+                     f"not {FEATURE_ENCODING!r}")
+
+# Callbacks invoked with a face ID whenever a row in 'faces' is added,
+# changed or removed (see FaceGallery).
+_face_listeners = []
+
+def add_face_listener(callback):
+    """Register callback(face_id) to be called after the 'faces' table changes."""
+    if callback not in _face_listeners:
+        _face_listeners.append(callback)
+
+def remove_face_listener(callback):
+    """Stop notifying a callback registered with add_face_listener."""
+    if callback in _face_listeners:
+        _face_listeners.remove(callback)
+
+def _notify_face_changed(face_id):
+    for callback in list(_face_listeners):
+        try:
+            callback(face_id)
+        except Exception as e:
+            print(f"Error in face listener: {e}")
+
+def connect():
+    """Return the calling thread's persistent connection to DB_PATH."""
+    return get_connection(DB_PATH)
+
 def init_db():
     """Create the database and tables if they don't exist."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect()
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -22,7 +57,44 @@ def init_db():
             name TEXT NOT NULL,
             relation TEXT,
             image_path TEXT NOT NULL,
-            features BLOB NOT NULL
+            features BLOB NOT NULL,
+            aligned INTEGER NOT NULL DEFAULT 1  -- 0: unaligned crop, -1: and re-embedding failed
+        )
+    """)
+
+    # Several embeddings per face covering different poses (see FaceGallery)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS face_prototypes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            face_id INTEGER NOT NULL,
+            features BLOB NOT NULL,
+            quality REAL NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_face_prototypes_face
+        ON face_prototypes (face_id)
+    """)
+
+    # Databases from before landmark alignment: their faces were embedded
+    # from unaligned crops and are re-embedded by realign. Faces with
+    # prototypes were enrolled after alignment was introduced.
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(faces)")]
+    if "aligned" not in columns:
+        cursor.execute("ALTER TABLE faces ADD COLUMN aligned INTEGER NOT NULL DEFAULT 1")
+        cursor.execute("""
+            UPDATE faces SET aligned = 0
+            WHERE id NOT IN (SELECT face_id FROM face_prototypes)
+        """)
+
+    # Source photos handled by the bulk importer, so an import can resume
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS face_imports (
+            source_path TEXT PRIMARY KEY,
+            face_id INTEGER,
+            status TEXT NOT NULL,  -- "ok" or "failed"
+            error TEXT,
+            imported_at INTEGER NOT NULL
         )
     """)
 
@@ -38,52 +110,185 @@ def init_db():
         )
     """)
 
+    # Source image -> content-addressed thumbnail (see thumbnail_cache)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS thumbnails (
+            source_path TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            source_mtime REAL NOT NULL
+        )
+    """)
+
+    # Indexes for newest-first, keyset-paginated history queries
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_recognitions_timestamp
+        ON recognitions (timestamp, id)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_recognitions_name_timestamp
+        ON recognitions (name, timestamp, id)
+    """)
+
     conn.commit()
-    conn.close()
 
 def save_recognition(name, relation, image_path, result):
     """Store face recognition result into the database."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO recognitions (name, relation, image_path, result, timestamp)
-        VALUES (?, ?, ?, ?, ?)
-    """, (name, relation, image_path, result, int(time.time())))
-    conn.commit()
-    conn.close()
+    conn = connect()
+    with conn:
+        conn.execute("""
+            INSERT INTO recognitions (name, relation, image_path, result, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        """, (name, relation, image_path, result, int(time.time())))
 
-def save_face_data(name, relation, image_path, features):
-    """Save a new face record into the 'faces' table."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO faces (name, relation, image_path, features)
-        VALUES (?, ?, ?, ?)
-    """, (name, relation, image_path, features.tobytes()))
-    conn.commit()
-    conn.close()
+def save_recognitions(records):
+    """
+    Store several recognition results in one transaction.
+    Each record is (name, relation, image_path, result, timestamp).
+    """
+    start = metrics.clock()
+    conn = connect()
+    with conn:
+        conn.executemany("""
+            INSERT INTO recognitions (name, relation, image_path, result, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        """, records)
+    metrics.since("db.save_recognitions", start)
 
-def manage_face():
+def save_face_data(name, relation, image_path, features, prototypes=None, qualities=None):
     """
-    Retrieve basic information (id, name, relation, image_path) for all faces
-    from the database. This is used to populate the 'Manage Faces' screen.
+    Save a new face record into the 'faces' table and return its ID.
+    `prototypes` are extra embeddings of the same person (one per row),
+    stored in 'face_prototypes' with their quality scores.
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, relation, image_path FROM faces")
-    faces = cursor.fetchall()
-    conn.close()
-    return faces
+    start = metrics.clock()
+    conn = connect()
+    with conn:
+        cursor = conn.execute("""
+            INSERT INTO faces (name, relation, image_path, features)
+            VALUES (?, ?, ?, ?)
+        """, (name, relation, image_path, encode_features(features, FEATURE_ENCODING)))
+        face_id = cursor.lastrowid
+
+        if prototypes is not None and len(prototypes):
+            if qualities is None:
+                qualities = np.zeros(len(prototypes))
+            conn.executemany("""
+                INSERT INTO face_prototypes (face_id, features, quality)
+                VALUES (?, ?, ?)
+            """, [(face_id, encode_features(p, FEATURE_ENCODING), float(q))
+                  for p, q in zip(prototypes, qualities)])
+    metrics.since("db.save_face_data", start)
+
+    _notify_face_changed(face_id)
+    return face_id
+
+def save_imported_faces(faces, failures=(), notify=True):
+    """
+    Save the results of a bulk import in one transaction and return the
+    new face IDs. Each face is (name, relation, image_path, features,
+    prototypes, qualities, source_paths); `failures` are (source_path,
+    error) pairs. Every source path is recorded in 'face_imports'.
+    """
+    start = metrics.clock()
+    now = int(time.time())
+    face_ids = []
+    conn = connect()
+    with conn:
+        for name, relation, image_path, features, prototypes, qualities, source_paths in faces:
+            cursor = conn.execute("""
+                INSERT INTO faces (name, relation, image_path, features)
+                VALUES (?, ?, ?, ?)
+            """, (name, relation, image_path, encode_features(features, FEATURE_ENCODING)))
+            face_id = cursor.lastrowid
+            face_ids.append(face_id)
+
+            conn.executemany("""
+                INSERT INTO face_prototypes (face_id, features, quality)
+                VALUES (?, ?, ?)
+            """, [(face_id, encode_features(p, FEATURE_ENCODING), float(q))
+                  for p, q in zip(prototypes, qualities)])
+            conn.executemany("""
+                INSERT OR REPLACE INTO face_imports (source_path, face_id, status, error, imported_at)
+                VALUES (?, ?, 'ok', NULL, ?)
+            """, [(path, face_id, now) for path in source_paths])
+
+        conn.executemany("""
+            INSERT OR REPLACE INTO face_imports (source_path, face_id, status, error, imported_at)
+            VALUES (?, NULL, 'failed', ?, ?)
+        """, [(path, error, now) for path, error in failures])
+    metrics.since("db.save_imported_faces", start)
+
+    if notify:
+        for face_id in face_ids:
+            _notify_face_changed(face_id)
+    return face_ids
+
+def get_import_status():
+    """Return {source_path: status} for every photo the bulk importer has handled."""
+    conn = connect()
+    return dict(conn.execute("SELECT source_path, status FROM face_imports").fetchall())
+
+def get_faces_page(limit=50, after=None):
+    """
+    Retrieve one page of (id, name, relation, image_path) rows for the
+    'Manage Faces' screen, in enrollment order. `after` is the id of the
+    last face of the previous page (None for the first page).
+    """
+    conn = connect()
+    cursor = conn.execute("""
+        SELECT id, name, relation, image_path FROM faces
+        WHERE id > ? ORDER BY id LIMIT ?
+    """, (after if after is not None else -1, limit))
+    return cursor.fetchall()
 
 def get_face():
     """Get (id, name, relation, features) for every face in the database."""
-    conn = sqlite3.connect(DB_PATH)
+    start = metrics.clock()
+    conn = connect()
     cursor = conn.cursor()
     cursor.execute("SELECT id, name, relation, features FROM faces")
     faces = cursor.fetchall()
-    conn.close()
+    metrics.since("db.get_face", start)
     return faces
 
+def get_prototypes(face_id=None):
+    """
+    Get (face_id, features) for the stored prototypes of one face, or of
+    every face when face_id is None, best quality first.
+    """
+    conn = connect()
+    if face_id is None:
+        cursor = conn.execute("""
+            SELECT face_id, features FROM face_prototypes
+            ORDER BY face_id, quality DESC, id
+        """)
+    else:
+        cursor = conn.execute("""
+            SELECT face_id, features FROM face_prototypes
+            WHERE face_id=? ORDER BY quality DESC, id
+        """, (face_id,))
+    return cursor.fetchall()
+
+def get_unaligned_faces():
+    """Get (id, image_path) for every face embedded from an unaligned crop."""
+    conn = connect()
+    return conn.execute("SELECT id, image_path FROM faces WHERE aligned = 0").fetchall()
+
+def mark_realign_failed(face_ids):
+    """Record faces that could not be re-embedded, so later runs skip them."""
+    conn = connect()
+    with conn:
+        conn.executemany("UPDATE faces SET aligned=-1 WHERE id=?", [(i,) for i in face_ids])
+
+def update_face_features(face_id, features):
+    """Replace a face's embedding with an aligned one."""
+    conn = connect()
+    with conn:
+        conn.execute("UPDATE faces SET features=?, aligned=1 WHERE id=?",
+                     (encode_features(features, FEATURE_ENCODING), face_id))
+
+    _notify_face_changed(face_id)
+
 def delete_face(face_id):
     """Remove a face record by ID, also delete its associated image file if present."""
     face = get_face_by_id(face_id)
@@ -94,27 +299,31 @@ def delete_face(face_id):
         except Exception as e:
             print(f"Error deleting image file: {e}")
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM faces WHERE id=?", (face_id,))
-    conn.commit()
-    conn.close()
+    conn = connect()
+    with conn:
+        conn.execute("DELETE FROM faces WHERE id=?", (face_id,))
+        conn.execute("DELETE FROM face_prototypes WHERE face_id=?", (face_id,))
+        if face:
+            conn.execute("DELETE FROM thumbnails WHERE source_path=?", (face['image_path'],))
+
+    _notify_face_changed(face_id)
 
 def update_face(face_id, new_name, new_relation):
     """Update name and relation fields for a specific face."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE faces SET name=?, relation=? WHERE id=?", (new_name, new_relation, face_id))
-    conn.commit()
-    conn.close()
+    conn = connect()
+    with conn:
+        conn.execute("UPDATE faces SET name=?, relation=? WHERE id=?", (new_name, new_relation, face_id))
+
+    _notify_face_changed(face_id)
 
 def get_face_by_id(face_id):
     """Retrieve full face record (including image_path and features) by ID."""
-    conn = sqlite3.connect(DB_PATH)
+    start = metrics.clock()
+    conn = connect()
     cursor = conn.cursor()
     cursor.execute("SELECT id, name, relation, image_path, features FROM faces WHERE id=?", (face_id,))
     face = cursor.fetchone()
-    conn.close()
+    metrics.since("db.get_face_by_id", start)
     
     if face:
         return {
@@ -128,16 +337,15 @@ def get_face_by_id(face_id):
 
 def get_name_by_id(face_id):
     """Return just the 'name' field for a given face ID."""
-    conn = sqlite3.connect("database.db")
+    conn = connect()
     cursor = conn.cursor()
     cursor.execute("SELECT name FROM faces WHERE id=?", (face_id,))
-    name = cursor.fetchone()[0]
-    conn.close()
-    return name
+    row = cursor.fetchone()
+    return row[0] if row else None
 
 def get_all_results():
     """Retrieve all recognition results, sorted by timestamp descending (newest first)."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect()
     cursor = conn.cursor()
     cursor.execute("""
         SELECT name, relation, image_path, result, timestamp 
@@ -146,17 +354,54 @@ def get_all_results():
     """)
     
     recognitions = cursor.fetchall()
-    
-    conn.close()
     return recognitions
 
+def get_results_page(limit=50, before=None, name=None, result=None, since=None, until=None):
+    """
+    Retrieve one page of recognition results, newest first.
+
+    `before` is the (timestamp, id) of the last row of the previous page
+    (None for the first page). Results can be filtered by exact name,
+    result, and a [since, until) timestamp range. Returns rows of
+    (id, name, relation, image_path, result, timestamp).
+    """
+    conditions, params = [], []
+    if before is not None:
+        conditions.append("(timestamp, id) < (?, ?)")
+        params.extend(before)
+    if name is not None:
+        conditions.append("name = ?")
+        params.append(name)
+    if result is not None:
+        conditions.append("result = ?")
+        params.append(result)
+    if since is not None:
+        conditions.append("timestamp >= ?")
+        params.append(int(since))
+    if until is not None:
+        conditions.append("timestamp < ?")
+        params.append(int(until))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    start = metrics.clock()
+    conn = connect()
+    cursor = conn.execute(f"""
+        SELECT id, name, relation, image_path, result, timestamp
+        FROM recognitions
+        {where}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    """, (*params, limit))
+    rows = cursor.fetchall()
+    metrics.since("db.get_results_page", start)
+    return rows
+
 def clear_recognition_history():
     """Delete all records from the recognitions table."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM recognitions")
-    conn.commit()
-    conn.close()
+    conn = connect()
+    with conn:
+        conn.execute("DELETE FROM recognitions")
+        conn.execute("DELETE FROM thumbnails WHERE source_path LIKE 'captured_face/%'")
     
     # delete captured pictures
     folder_path = "captured_face"
@@ -165,11 +410,10 @@ def clear_recognition_history():
 
 
 def print_table_faces():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM faces")
     rows = cursor.fetchall()
-    conn.close()
 
     for row in rows:
         print(row)
@@ -0,0 +1,129 @@
+"""
+Cheap image-quality measures for detected faces.
+
+QualityGate rejects detections that cannot give a confident match
+(blurry, tiny, too dark or bright, or cut off by the frame edge) before
+the embedding model is run on them, and counts rejections by reason.
+quality_score ranks enrollment samples so the sharpest, largest and most
+confidently detected captures become the stored prototypes and image.
+Everything here works on the detector output and a small grayscale crop,
+so it costs far less than running the embedding model.
+"""
+
+import threading
+import cv2
+import numpy as np
+
+SHARPNESS_REFERENCE = 100.0  # Laplacian variance of a clearly sharp face
+SIZE_REFERENCE = 112  # face height in pixels the embedder is fed at
+GRAY_SIZE = 64  # crops are measured at this size so thresholds don't depend on face size
+
+
+def face_crop(frame, box):
+    """The part of the frame inside box, clipped to the frame; may be empty."""
+    h, w = frame.shape[:2]
+    x1, y1, x2, y2 = (int(v) for v in box)
+    return frame[max(0, y1):min(h, y2), max(0, x1):min(w, x2)]
+
+
+def gray_face(frame, box):
+    """The face crop as a GRAY_SIZE x GRAY_SIZE grayscale image, or None if empty."""
+    crop = face_crop(frame, box)
+    if crop.size == 0:
+        return None
+    if crop.ndim == 3:
+        crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(crop, (GRAY_SIZE, GRAY_SIZE), interpolation=cv2.INTER_AREA)
+
+
+def sharpness(gray):
+    """Variance of the Laplacian; low values mean a blurry image."""
+    if gray.size == 0:
+        return 0.0
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def quality_score(frame, face):
+    """
+    Score one detection (a FACE_DTYPE record) between 0 and 1 from its
+    sharpness, its size relative to the embedder input and the detector
+    score.
+    """
+    box = face['box']
+    gray = gray_face(frame, box)
+    if gray is None:
+        return 0.0
+    sharp = min(sharpness(gray) / SHARPNESS_REFERENCE, 1.0)
+    size = min((box[3] - box[1]) / SIZE_REFERENCE, 1.0)
+    return float(np.clip(sharp * max(size, 0.0) * float(face['score']), 0.0, 1.0))
+
+
+class QualityGate:
+    """
+    Accepts or rejects detections before they are embedded. check()
+    returns None for a usable face, otherwise the reason it was rejected.
+    """
+
+    REASONS = ("invalid_box", "out_of_frame", "too_small", "too_dark", "too_bright", "blurry")
+
+    def __init__(self, min_size=48, min_sharpness=20.0, min_brightness=40.0,
+                 max_brightness=220.0, max_outside=0.1):
+        self.min_size = min_size  # shorter box side, in pixels
+        self.min_sharpness = min_sharpness  # Laplacian variance of the GRAY_SIZE crop
+        self.min_brightness = min_brightness  # mean gray level
+        self.max_brightness = max_brightness
+        self.max_outside = max_outside  # fraction of the box allowed outside the frame
+        self.lock = threading.Lock()
+        self.passed = 0
+        self.rejected = dict.fromkeys(self.REASONS, 0)
+
+    def assess(self, frame, face):
+        """Return the rejection reason for one detection, or None; not counted."""
+        x1, y1, x2, y2 = (float(v) for v in face['box'])
+        w, h = x2 - x1, y2 - y1
+        if w <= 0 or h <= 0:
+            return "invalid_box"
+
+        frame_h, frame_w = frame.shape[:2]
+        inside_w = min(x2, frame_w) - max(x1, 0)
+        inside_h = min(y2, frame_h) - max(y1, 0)
+        if inside_w <= 0 or inside_h <= 0:
+            return "invalid_box"
+        if 1.0 - (inside_w * inside_h) / (w * h) > self.max_outside:
+            return "out_of_frame"
+
+        if min(w, h) < self.min_size:
+            return "too_small"
+
+        gray = gray_face(frame, face['box'])
+        brightness = float(gray.mean())
+        if brightness < self.min_brightness:
+            return "too_dark"
+        if brightness > self.max_brightness:
+            return "too_bright"
+        if sharpness(gray) < self.min_sharpness:
+            return "blurry"
+        return None
+
+    def check(self, frame, face):
+        """Like assess(), but counted in the statistics."""
+        reason = self.assess(frame, face)
+        with self.lock:
+            if reason is None:
+                self.passed += 1
+            else:
+                self.rejected[reason] += 1
+        return reason
+
+    def filter(self, frame, faces):
+        """Return the indices of the detections that pass the gate."""
+        return [i for i in range(len(faces)) if self.check(frame, faces[i]) is None]
+
+    def stats(self):
+        with self.lock:
+            return {"passed": self.passed, "rejected": dict(self.rejected)}
+
+    def reset_stats(self):
+        with self.lock:
+            self.passed = 0
+            self.rejected = dict.fromkeys(self.REASONS, 0)
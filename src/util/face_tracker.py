@@ -0,0 +1,116 @@
+"""
+IoU-based face tracking between detections. A track only needs a new
+embedding when it is new, has drifted from where it was last embedded,
+or its confidence has decayed with time.
+"""
+
+import itertools
+import numpy as np
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU between (N, 4) and (M, 4) arrays of (x1, y1, x2, y2) boxes."""
+    a = np.asarray(boxes_a, dtype=np.float32)[:, None, :]
+    b = np.asarray(boxes_b, dtype=np.float32)[None, :, :]
+    w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = w * h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+
+class Track:
+    """One face followed across frames."""
+
+    def __init__(self, track_id, box, detection_index):
+        self.track_id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.detection_index = detection_index  # row in the latest detections
+        self.embedding = None
+        self.match = None  # (name, confidence, relation) from the last embedding
+        self.embedded_box = None  # box at the time of the last embedding
+        self.confidence = 0.0  # 1.0 right after embedding, decays every frame
+        self.hits = 1  # detections matched to this track
+        self.misses = 0  # consecutive detections without a match
+
+    def set_embedding(self, embedding, match):
+        """Store a fresh embedding and its match for the current box."""
+        self.embedding = embedding
+        self.match = match
+        self.embedded_box = self.box.copy()
+        self.confidence = 1.0
+
+
+class FaceTracker:
+    """
+    Greedy IoU tracker.
+
+    update() is called with the boxes of a new detection; step() is called
+    for frames on which detection was skipped so confidences keep decaying.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_misses=2, drift_iou=0.6,
+                 confidence_decay=0.99, min_confidence=0.5):
+        self.iou_threshold = iou_threshold  # minimum overlap to continue a track
+        self.max_misses = max_misses  # detections a track may go unmatched
+        self.drift_iou = drift_iou  # re-embed once overlap with the embedded box drops below this
+        self.confidence_decay = confidence_decay  # per frame
+        self.min_confidence = min_confidence  # re-embed below this
+        self.tracks = []
+        self.ids = itertools.count(1)
+
+    def reset(self):
+        self.tracks = []
+
+    def step(self):
+        """Age every track by one frame without a detection."""
+        for track in self.tracks:
+            track.confidence *= self.confidence_decay
+
+    def update(self, boxes):
+        """
+        Match detected boxes to tracks, start tracks for new faces and drop
+        lost ones. Returns the tracks that were seen in this detection.
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.step()
+
+        matched_tracks, matched_boxes = set(), set()
+        if self.tracks and len(boxes):
+            ious = iou_matrix([t.box for t in self.tracks], boxes)
+            # Best overlaps first
+            for flat in np.argsort(-ious, axis=None):
+                t, b = np.unravel_index(flat, ious.shape)
+                if ious[t, b] < self.iou_threshold:
+                    break
+                if t in matched_tracks or b in matched_boxes:
+                    continue
+                track = self.tracks[t]
+                track.box = boxes[b]
+                track.detection_index = int(b)
+                track.hits += 1
+                track.misses = 0
+                matched_tracks.add(t)
+                matched_boxes.add(b)
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+                track.detection_index = None
+
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        for b in range(len(boxes)):
+            if b not in matched_boxes:
+                self.tracks.append(Track(next(self.ids), boxes[b], b))
+
+        return [t for t in self.tracks if t.detection_index is not None]
+
+    def needs_embedding(self, track):
+        """True if a visible track is new, has drifted or has gone stale."""
+        if track.detection_index is None:
+            return False
+        if track.embedding is None or track.confidence < self.min_confidence:
+            return True
+        return bool(iou_matrix([track.box], [track.embedded_box])[0, 0] < self.drift_iou)
@@ -0,0 +1,160 @@
+"""
+Background frame processing: a fixed set of worker threads reads from a
+small queue that drops the oldest waiting frame when it is full.
+"""
+
+import threading
+import time
+from collections import deque
+
+from src.util.metrics import metrics
+
+
+class LatestFrameQueue:
+    """A bounded queue that drops its oldest item instead of blocking the producer."""
+
+    def __init__(self, maxsize=1):
+        self.items = deque(maxlen=maxsize)
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def put(self, item):
+        """Add an item; returns True if an older item had to be dropped."""
+        with self.condition:
+            dropped = len(self.items) == self.items.maxlen
+            self.items.append(item)
+            self.condition.notify()
+            return dropped
+
+    def get(self, timeout=None):
+        """Wait for the oldest remaining item; returns None once closed."""
+        with self.condition:
+            while not self.items and not self.closed:
+                if not self.condition.wait(timeout):
+                    return None
+            if self.closed:
+                return None
+            return self.items.popleft()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.items.clear()
+            self.condition.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class FramePipeline:
+    """
+    Runs `process(frame)` on long-lived worker threads. Frames are handed
+    over with submit(), which never blocks; frames the workers cannot keep
+    up with are dropped and counted.
+    """
+
+    def __init__(self, process, num_workers=1, maxsize=1, name="frame-pipeline"):
+        self.process = process
+        self.num_workers = num_workers
+        self.maxsize = maxsize
+        self.name = name
+
+        self.queue = None
+        self.workers = []
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.submitted = 0
+            self.dropped = 0
+            self.processed = 0
+            self.errors = 0
+            self.busy = 0
+            self.total_latency = 0.0  # seconds from submit() to finished
+            self.max_latency = 0.0
+            self.last_latency = 0.0
+
+    @property
+    def running(self):
+        return bool(self.workers)
+
+    def start(self):
+        """Start the worker threads (no-op if already running)."""
+        if self.running:
+            return
+        self.queue = LatestFrameQueue(self.maxsize)
+        self.workers = [
+            threading.Thread(target=self._run, args=(self.queue,), name=f"{self.name}-{i}", daemon=True)
+            for i in range(self.num_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self, timeout=1.0):
+        """Discard waiting frames and stop the workers."""
+        if not self.running:
+            return
+        self.queue.close()
+        for worker in self.workers:
+            if worker is not threading.current_thread():
+                worker.join(timeout)
+        self.workers = []
+
+    def submit(self, frame):
+        """Queue a frame for processing. Returns False if it replaced an older frame."""
+        if not self.running:
+            return False
+        dropped = self.queue.put((time.perf_counter(), frame))
+        with self.lock:
+            self.submitted += 1
+            if dropped:
+                self.dropped += 1
+        if dropped:
+            metrics.count(f"{self.name}.dropped")
+        return not dropped
+
+    def _run(self, queue):
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+
+            submitted_at, frame = item
+            with self.lock:
+                self.busy += 1
+            metrics.since(f"{self.name}.queue_wait", submitted_at)
+            process_start = metrics.clock()
+            try:
+                self.process(frame)
+                failed = False
+            except Exception as e:
+                print(f"Error processing frame: {e}")
+                failed = True
+
+            latency = time.perf_counter() - submitted_at
+            metrics.since(f"{self.name}.process", process_start)
+            metrics.since(f"{self.name}.latency", submitted_at)
+            with self.lock:
+                self.busy -= 1
+                self.processed += 1
+                self.errors += failed
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+                self.last_latency = latency
+
+    def stats(self):
+        """Return a snapshot of throughput and backpressure counters."""
+        with self.lock:
+            return {
+                "submitted": self.submitted,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "busy_workers": self.busy,
+                "workers": len(self.workers),
+                "queue_depth": len(self.queue) if self.queue else 0,
+                "avg_latency_ms": 1000 * self.total_latency / self.processed if self.processed else 0.0,
+                "max_latency_ms": 1000 * self.max_latency,
+                "last_latency_ms": 1000 * self.last_latency,
+            }
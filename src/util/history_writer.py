@@ -0,0 +1,176 @@
+"""
+Write-behind logger for recognition history.
+
+Recognition results and their captured frames are queued in memory and
+written by a background thread, so the result screen never waits on a
+PNG encode or an SQLite commit.
+
+Durability policy: queued events are written in one transaction at most
+`flush_interval` seconds after they were logged, or as soon as
+`max_batch` events are waiting, whichever comes first. flush() forces a
+write and waits for it; close() (also run at interpreter exit) writes
+everything that is still queued. Only events logged within the last
+flush interval can be lost, and only if the process is killed.
+"""
+
+import atexit
+import os
+import re
+import threading
+import time
+import cv2
+
+from src.util.face_manager import save_recognitions
+from src.util.thumbnail_cache import create_thumbnail
+
+CAPTURE_DIR = "captured_face"
+
+
+class HistoryWriter:
+    """Queues recognition records and frame images and writes them in batches."""
+
+    def __init__(self, flush_interval=1.0, max_batch=64, max_pending_images=256, image_dir=CAPTURE_DIR):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_pending_images = max_pending_images
+        self.image_dir = image_dir
+
+        self.condition = threading.Condition()
+        self.pending = []  # ("image", path, frame) and ("record", row) items
+        self.pending_images = 0
+        self.oldest_pending = None  # time the oldest pending item was queued
+        self.queued = 0  # items ever queued
+        self.written = 0  # items ever written
+        self.dropped_images = 0
+        self.flush_requested = False
+        self.closed = False
+        self.next_image_id = None
+
+        self.thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _reserve_image_path(self):
+        # Scan the folder once; afterwards numbers come from a counter.
+        if self.next_image_id is None:
+            numbers = [0]
+            if os.path.exists(self.image_dir):
+                for file_name in os.listdir(self.image_dir):
+                    match = re.match(r"captured_face_(\d+)\.png$", file_name)
+                    if match:
+                        numbers.append(int(match.group(1)))
+            self.next_image_id = max(numbers) + 1
+
+        path = f"{self.image_dir}/captured_face_{self.next_image_id}.png"
+        self.next_image_id += 1
+        return path
+
+    def _queue(self, item):
+        self.pending.append(item)
+        self.queued += 1
+        if self.oldest_pending is None:
+            self.oldest_pending = time.monotonic()
+        self.condition.notify()
+
+    def save_image(self, image):
+        """
+        Queue an image to be encoded and saved in the background and
+        return the path it will be written to. The image must not be
+        modified afterwards. Returns "" if the image was dropped because
+        too many are already waiting, so no row points at a missing file.
+        """
+        with self.condition:
+            if self.closed:
+                path = self._reserve_image_path()
+                self._write([("image", path, image)])
+                return path
+            if self.pending_images >= self.max_pending_images:
+                self.dropped_images += 1
+                return ""
+            path = self._reserve_image_path()
+            self.pending_images += 1
+            self._queue(("image", path, image))
+        return path
+
+    def log(self, name, relation, image_path, result):
+        """Queue one recognition result (same arguments as save_recognition)."""
+        with self.condition:
+            if self.closed:
+                save_recognitions([(name, relation, image_path, result, int(time.time()))])
+                return
+            self._queue(("record", (name, relation, image_path, result, int(time.time()))))
+
+    def flush(self, timeout=None):
+        """Write everything queued so far and wait until it is on disk."""
+        with self.condition:
+            target = self.queued
+            self.flush_requested = True
+            self.condition.notify_all()
+            return self.condition.wait_for(lambda: self.written >= target or not self.thread.is_alive(), timeout)
+
+    def close(self, timeout=5.0):
+        """Write all remaining events and stop the background thread."""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+
+    def _batch_due(self):
+        if self.closed or self.flush_requested or len(self.pending) >= self.max_batch:
+            return True
+        return bool(self.pending) and time.monotonic() - self.oldest_pending >= self.flush_interval
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self._batch_due():
+                    timeout = None
+                    if self.pending:
+                        timeout = max(0.0, self.flush_interval - (time.monotonic() - self.oldest_pending))
+                    self.condition.wait(timeout)
+
+                batch, self.pending = self.pending, []
+                self.pending_images = 0
+                self.oldest_pending = None
+                self.flush_requested = False
+                done = self.closed
+
+            self._write(batch)
+
+            with self.condition:
+                self.written += len(batch)
+                self.condition.notify_all()
+                if done and not self.pending:
+                    return
+
+    def _write(self, batch):
+        # Images first, so every committed row points at an existing file.
+        records = []
+        for item in batch:
+            if item[0] == "image":
+                _, path, image = item
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    cv2.imwrite(path, image)
+                    create_thumbnail(path, image)
+                except Exception as e:
+                    print(f"Error saving history image {path}: {e}")
+            else:
+                records.append(item[1])
+
+        if records:
+            try:
+                save_recognitions(records)
+            except Exception as e:
+                print(f"Error saving recognition history: {e}")
+
+    def stats(self):
+        with self.condition:
+            return {
+                "queued": self.queued,
+                "written": self.written,
+                "pending": len(self.pending),
+                "dropped_images": self.dropped_images,
+            }
@@ -1,6 +1,9 @@
 import cv2
 import numpy as np
-import sys
+import queue
+from contextlib import contextmanager
+
+from src.util.metrics import metrics
 
 try:
     # Try importing the lightweight TFLite runtime first
@@ -15,76 +18,337 @@ except ImportError:
         raise ImportError("Neither tflite-runtime nor TensorFlow is installed. Please install one.")
 
 
+FACE_MODEL_PATH = "models/mobilefacenet.tflite"
+DETECT_MODEL_PATH = "models/face_detection.tflite"
+
+# One detected face: pixel box (x1, y1, x2, y2), detector score, and the
+# six detector keypoints (eyes, nose, mouth, ears) as (x, y) pixels.
+FACE_DTYPE = np.dtype([
+    ('box', np.int32, (4,)),
+    ('score', np.float32),
+    ('landmarks', np.int32, (6, 2)),
+])
+
+
+# Where the eyes, nose tip and mouth centre of an aligned face sit in the
+# 112x112 MobileFaceNet input (standard ArcFace template; the mouth centre
+# is the midpoint of its two mouth corners). Detector keypoints 0-3 are
+# right eye, left eye, nose tip and mouth centre.
+ALIGN_TEMPLATE = np.array([
+    [38.2946, 51.6963],
+    [73.5318, 51.5014],
+    [56.0252, 71.7366],
+    [56.1396, 92.2848],
+], dtype=np.float32)
+ALIGN_TEMPLATE_SIZE = 112
+
+
+def similarity_transform(src, dst):
+    """
+    Least-squares similarity transform (rotation, uniform scale,
+    translation) mapping src points onto dst points, as a 2x3 matrix.
+    Returns None if the points are degenerate.
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    n = src.shape[0]
+
+    # u = a*x - b*y + tx,  v = b*x + a*y + ty
+    A = np.zeros((2 * n, 4))
+    A[0::2] = np.column_stack([src[:, 0], -src[:, 1], np.ones(n), np.zeros(n)])
+    A[1::2] = np.column_stack([src[:, 1], src[:, 0], np.zeros(n), np.ones(n)])
+    (a, b, tx, ty), *_ = np.linalg.lstsq(A, dst.reshape(-1), rcond=None)
+
+    if not np.isfinite([a, b, tx, ty]).all() or a * a + b * b < 1e-8:
+        return None
+    return np.array([[a, -b, tx], [b, a, ty]], dtype=np.float32)
+
+
+def box_transform(box, size):
+    """2x3 transform that scales an (x1, y1, x2, y2) box onto a (w, h) image."""
+    x1, y1, x2, y2 = (float(v) for v in box)
+    sx = size[0] / max(x2 - x1, 1.0)
+    sy = size[1] / max(y2 - y1, 1.0)
+    return np.array([[sx, 0, -x1 * sx], [0, sy, -y1 * sy]], dtype=np.float32)
+
+
+def box_iou(box, boxes):
+    """IoU between one (x1, y1, x2, y2) box and an (N, 4) array of boxes."""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-6)
+
+
+def non_max_suppression(boxes, scores, iou_threshold=0.3):
+    """
+    Greedy NMS. Returns one index array per kept detection, starting with
+    the kept detection followed by the ones it suppressed.
+    """
+    order = np.argsort(-scores)
+    groups = []
+    while order.size:
+        overlap = box_iou(boxes[order[0]], boxes[order]) > iou_threshold
+        overlap[0] = True
+        groups.append(order[overlap])
+        order = order[~overlap]
+    return groups
+
+
+class InterpreterPool:
+    """
+    A fixed number of interpreters for one model. TFLite interpreters are
+    not thread-safe, so each one is lent to a single thread at a time via
+    acquire(); independent interpreters run in parallel because invoke()
+    releases the GIL.
+    """
+
+    def __init__(self, model_path, size=1, num_threads=None, wrapper=None):
+        self.model_path = model_path
+        self.size = size
+        self.slots = queue.Queue()
+
+        for _ in range(size):
+            interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+            interpreter.allocate_tensors()
+            self.slots.put(wrapper(interpreter) if wrapper else interpreter)
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        """Borrow an interpreter, waiting until one is free."""
+        slot = self.slots.get(timeout=timeout)
+        try:
+            yield slot
+        finally:
+            self.slots.put(slot)
+
+
+class FaceModel:
+    """One MobileFaceNet interpreter plus its preallocated input buffers."""
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.input_details = interpreter.get_input_details()
+        self.output_details = interpreter.get_output_details()
+
+        # A batch dimension of -1 in the signature means the model accepts
+        # any batch size once the input tensor has been resized.
+        signature = self.input_details[0].get('shape_signature', self.input_details[0]['shape'])
+        self.dynamic_batch = signature[0] == -1
+        self.batch_size = int(self.input_details[0]['shape'][0])
+        self.face_size = tuple(int(v) for v in self.input_details[0]['shape'][1:3])
+
+        # Preallocated input tensor and resize scratch buffer
+        self.batch = np.empty((self.batch_size, *self.face_size, 3), dtype=np.float32)
+        self.resized = np.empty((*self.face_size, 3), dtype=np.uint8)
+
+    def resize_batch(self, batch_size):
+        """Resize a dynamic-batch model (and the input buffer) to batch_size."""
+        index = self.input_details[0]['index']
+        self.interpreter.resize_tensor_input(index, [batch_size, *self.face_size, 3])
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+        self.batch_size = batch_size
+        self.batch = np.empty((batch_size, *self.face_size, 3), dtype=np.float32)
+
+    def embed(self, images):
+        """Run the model over a list of face crops; returns an (N, D) matrix."""
+        def load(i):
+            cv2.resize(images[i], self.face_size[::-1], dst=self.resized)
+        return self._embed(len(images), load)
+
+    def embed_warped(self, frames, transforms):
+        """
+        Embed faces taken straight from full frames: each 2x3 transform
+        warps one face of the matching frame into the model input without
+        a separate crop.
+        """
+        def load(i):
+            cv2.warpAffine(frames[i], transforms[i], self.face_size[::-1], dst=self.resized,
+                           flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+        return self._embed(len(transforms), load)
+
+    def _embed(self, count, load):
+        # load(i) writes face i into self.resized as uint8
+        if self.dynamic_batch and self.batch_size < count:
+            self.resize_batch(count)
+
+        batch_size = self.batch_size
+        results = []
+
+        for start in range(0, count, batch_size):
+            chunk = min(batch_size, count - start)
+
+            stage_start = metrics.clock()
+            for i in range(chunk):
+                # Bring face into the model input (112x112) and normalize to [-1, 1]
+                load(start + i)
+                np.multiply(self.resized, 1 / 127.5, out=self.batch[i], casting='unsafe')
+                self.batch[i] -= 1
+
+            # Unused slots of a fixed-size batch repeat the last face.
+            if chunk < batch_size:
+                self.batch[chunk:] = self.batch[chunk - 1]
+            metrics.since("embed.preprocess", stage_start)
+
+            stage_start = metrics.clock()
+            self.interpreter.set_tensor(self.input_details[0]['index'], self.batch)
+            self.interpreter.invoke()
+            features = self.interpreter.get_tensor(self.output_details[0]['index'])
+            metrics.since("embed.invoke", stage_start)
+            metrics.count("embed.faces", chunk)
+            results.append(features.reshape(batch_size, -1)[:chunk].copy())
+
+        return np.vstack(results).astype(np.float32, copy=False)
+
+
+class DetectModel:
+    """One face detection interpreter."""
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.input_details = interpreter.get_input_details()
+        self.output_details = interpreter.get_output_details()
+
+    def run(self, input_data):
+        """Invoke the detector; returns copies of the raw (boxes, scores) outputs."""
+        self.interpreter.set_tensor(self.input_details[0]['index'], input_data)
+        self.interpreter.invoke()
+        boxes = self.interpreter.get_tensor(self.output_details[0]['index'])[0].copy()
+        scores = self.interpreter.get_tensor(self.output_details[1]['index'])[0].copy()
+        return boxes, scores
+
+
 class ImageManager():
-    def __init__(self, **kwargs):
+    """
+    Face detection and embedding. Each model is backed by a pool of
+    `pool_size` interpreters using `num_threads` threads each, so
+    detect_faces and extract_features can be called from several threads.
+    """
+
+    def __init__(self, pool_size=2, num_threads=None, **kwargs):
         super().__init__(**kwargs)
+        self.pool_size = pool_size
+        self.num_threads = num_threads
         self.init_face_model()
         self.init_detect_model()
 
     def init_face_model(self):
-        self.face_model = Interpreter(model_path="models/mobilefacenet.tflite")
-        self.face_model.allocate_tensors()
-        self.input_details = self.face_model.get_input_details()
-        self.output_details = self.face_model.get_output_details()
+        self.face_pool = InterpreterPool(FACE_MODEL_PATH, self.pool_size, self.num_threads, FaceModel)
+        with self.face_pool.acquire() as model:
+            self.face_size = model.face_size  # (h, w)
 
     def init_detect_model(self):
-        self.detect_model = Interpreter(model_path="models/face_detection.tflite")
-        self.detect_model.allocate_tensors()
-        self.detect_input_details = self.detect_model.get_input_details()
-        self.detect_output_details = self.detect_model.get_output_details()
+        self.detect_pool = InterpreterPool(DETECT_MODEL_PATH, self.pool_size, self.num_threads, DetectModel)
 
     def extract_features(self, image):
         """Extract facial feature vector using MobileFaceNet."""
-        # Resize the image to match the input size of the model (112x112)
-        img = cv2.resize(image, (112, 112))
-    
-        # Normalize pixel values to the range [-1, 1]
-        img = img.astype(np.float32) / 127.5 - 1
+        return self.extract_features_batch([image])[0]
+
+    def extract_features_batch(self, images):
+        """
+        Extract feature vectors for several face crops, filling the model's
+        batch dimension with distinct faces. Returns an (N, D) matrix.
+        """
+        if not images:
+            return np.empty((0, 0), dtype=np.float32)
+
+        with self.face_pool.acquire() as model:
+            return model.embed(images)
 
-        # img = np.expand_dims(img, axis=0)
+    def alignment_transform(self, face):
+        """
+        Similarity transform that maps one FACE_DTYPE detection from the
+        full frame onto the embedding model's input, using its eye, nose
+        and mouth keypoints. Falls back to the plain box if the keypoints
+        are unusable.
+        """
+        h, w = self.face_size
+        template = ALIGN_TEMPLATE * np.array([w, h], dtype=np.float32) / ALIGN_TEMPLATE_SIZE
+        transform = similarity_transform(face['landmarks'][:4], template)
+        if transform is None:
+            transform = box_transform(face['box'], (w, h))
+        return transform
 
-         # If the model expects a batch size of 2, duplicate the image
-        if self.input_details[0]['shape'][0] == 2:
-            img = np.tile(img, (2, 1, 1, 1))  # Shape: (2, 112, 112, 3)
+    def extract_features_aligned(self, frame, faces):
+        """
+        Align every detection from detect_faces_full and embed them in one
+        batch, warping straight from the frame into the model input.
+        Returns an (N, D) matrix.
+        """
+        return self.extract_features_aligned_batch([(frame, face) for face in faces])
 
-        self.face_model.set_tensor(self.input_details[0]['index'], img)
-        self.face_model.invoke()
-        features = self.face_model.get_tensor(self.output_details[0]['index'])
+    def extract_features_aligned_batch(self, items):
+        """
+        Like extract_features_aligned for (frame, detection) pairs that may
+        come from different frames; all faces go through one batch.
+        """
+        if len(items) == 0:
+            return np.empty((0, 0), dtype=np.float32)
 
-        return features.flatten()
+        frames = [frame for frame, _ in items]
+        transforms = [self.alignment_transform(face) for _, face in items]
+        with self.face_pool.acquire() as model:
+            return model.embed_warped(frames, transforms)
 
     def detect_faces(self, frame, threshold=0.6):
+        """Return (x1, y1, x2, y2) boxes of the detected faces, best first."""
+        return [tuple(int(v) for v in box) for box in self.detect_faces_full(frame, threshold)['box']]
 
+    def detect_faces_full(self, frame, threshold=0.6, iou_threshold=0.3, blend=True):
+        """
+        Detect faces and return a FACE_DTYPE structured array of boxes,
+        scores and the six detector keypoints, sorted by score.
+        Overlapping detections of the same face are merged by
+        non-maximum suppression; with `blend` the kept box and keypoints
+        are the score-weighted average of the overlapping ones.
+        """
+        stage_start = metrics.clock()
         img_resized = cv2.resize(frame, (128,128))
         img_resized = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
 
         input_data = (np.expand_dims(img_resized, axis=0).astype(np.float32) - 127.5) / 127.5
+        metrics.since("detect.preprocess", stage_start)
 
-        self.detect_model.set_tensor(self.detect_input_details[0]['index'], input_data)
-        self.detect_model.invoke()
-
-        boxes = self.detect_model.get_tensor(self.detect_output_details[0]['index'])[0]
-        scores = self.detect_model.get_tensor(self.detect_output_details[1]['index'])[0]
-
-        h, w, _ = frame.shape
-        faces = []
+        stage_start = metrics.clock()
+        with self.detect_pool.acquire() as model:
+            metrics.since("detect.wait", stage_start)
+            stage_start = metrics.clock()
+            boxes, scores = model.run(input_data)
+            metrics.since("detect.invoke", stage_start)
 
-        for i, score in enumerate(scores):
-            if score >= threshold:
-                box = boxes[i]
-                x_center, y_center, box_width, box_height = box[:4]
+        stage_start = metrics.clock()
+        scores = scores.reshape(-1)
+        hits = np.flatnonzero(scores >= threshold)
+        if hits.size == 0:
+            metrics.since("detect.decode", stage_start)
+            return np.empty(0, dtype=FACE_DTYPE)
 
-                xmin = int((x_center - box_width / 2) * w)
-                ymin = int((y_center - box_height / 2) * h)
-                xmax = int((x_center + box_width / 2) * w)
-                ymax = int((y_center + box_height / 2) * h)
+        # Decode all boxes and keypoints above the threshold at once
+        h, w = frame.shape[:2]
+        scale = np.array([w, h], dtype=np.float32)
+        raw = boxes[hits]
+        corners = np.hstack([raw[:, 0:2] - raw[:, 2:4] / 2, raw[:, 0:2] + raw[:, 2:4] / 2]) * np.tile(scale, 2)
+        landmarks = raw[:, 4:16].reshape(-1, 6, 2) * scale
+        scores = scores[hits]
 
-                keypoints = []
-                for j in range(4, 16, 2):
-                    kp_x = int(box[j] * w) 
-                    kp_y = int(box[j + 1] * h)
-                    keypoints.append((kp_x, kp_y))
+        groups = non_max_suppression(corners, scores, iou_threshold)
 
-                faces.append((xmin, ymin, xmax, ymax))
+        faces = np.empty(len(groups), dtype=FACE_DTYPE)
+        for i, group in enumerate(groups):
+            if blend and group.size > 1:
+                weights = scores[group] / scores[group].sum()
+                box = weights @ corners[group]
+                points = np.tensordot(weights, landmarks[group], axes=1)
+            else:
+                box, points = corners[group[0]], landmarks[group[0]]
+            faces[i] = (box.astype(np.int32), scores[group[0]], points.astype(np.int32))
 
+        metrics.since("detect.decode", stage_start)
+        metrics.count("detect.faces", len(faces))
         return faces
@@ -0,0 +1,224 @@
+"""
+Optional hot-path metrics. Set FACEAPP_METRICS=1 to record per-stage
+latency histograms, counters and gauges for the camera, detector,
+embedder, matcher and database calls.
+
+Timing a stage costs two calls:
+
+    start = metrics.clock()
+    ...
+    metrics.since("detect.invoke", start)
+
+When metrics are disabled clock() returns 0.0 and since()/count()/gauge()
+return immediately, so the instrumented code pays almost nothing.
+
+With FACEAPP_METRICS_FILE set, a snapshot is written to that file every
+FACEAPP_METRICS_INTERVAL seconds (default 10): Prometheus text format if
+the name ends in ".prom", JSON otherwise. FACEAPP_METRICS_OVERLAY=1 also
+shows FPS and stage latencies on the recognition screen.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+
+DUMP_PATH = os.environ.get("FACEAPP_METRICS_FILE")
+DUMP_INTERVAL = float(os.environ.get("FACEAPP_METRICS_INTERVAL", "10"))
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, float("inf"))
+
+
+class Histogram:
+    """Fixed-bucket latency histogram."""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (max for the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 3),
+            "p90_ms": round(self.percentile(90), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+class Metrics:
+    """Process-wide histograms, counters and gauges."""
+
+    def __init__(self, enabled=False, overlay=False):
+        self.enabled = enabled
+        self.overlay = enabled and overlay
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.collectors = {}  # name -> callable returning {gauge: value}, read at snapshot time
+        self.dump_thread = None
+        self.dump_stop = threading.Event()
+
+    def clock(self):
+        """Start time for since(); 0.0 when disabled."""
+        return time.perf_counter() if self.enabled else 0.0
+
+    def since(self, name, start):
+        """Record the time from `start` (from clock()) until now under `name`."""
+        if not self.enabled:
+            return
+        ms = (time.perf_counter() - start) * 1000
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(ms)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges[name] = value
+
+    def add_collector(self, name, collect):
+        """Call collect() for extra gauges (e.g. queue depths) whenever a snapshot is taken."""
+        if self.enabled:
+            with self.lock:
+                self.collectors[name] = collect
+
+    def remove_collector(self, name):
+        with self.lock:
+            self.collectors.pop(name, None)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+            self.started = time.time()
+
+    def snapshot(self):
+        """Return every metric as plain data."""
+        with self.lock:
+            collectors = list(self.collectors.items())
+            gauges = dict(self.gauges)
+            counters = dict(self.counters)
+            histograms = {name: h.summary() for name, h in self.histograms.items()}
+            buckets = {name: list(h.counts) for name, h in self.histograms.items()}
+            totals = {name: h.total_ms for name, h in self.histograms.items()}
+
+        for prefix, collect in collectors:
+            try:
+                for key, value in collect().items():
+                    gauges[f"{prefix}.{key}"] = value
+            except Exception as e:
+                print(f"Error collecting metrics from {prefix}: {e}")
+
+        return {
+            "timestamp": time.time(),
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "counters": counters,
+            "gauges": gauges,
+            "histograms": histograms,
+            "_buckets": buckets,
+            "_totals_ms": totals,
+        }
+
+    def to_json(self, snapshot=None):
+        snapshot = snapshot or self.snapshot()
+        return json.dumps({k: v for k, v in snapshot.items() if not k.startswith("_")}, indent=2)
+
+    def to_prometheus(self, snapshot=None):
+        """Prometheus text exposition format."""
+        snapshot = snapshot or self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = _metric_name(name) + "_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, value in sorted(snapshot["gauges"].items()):
+            if isinstance(value, (int, float)):
+                metric = _metric_name(name)
+                lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        for name, counts in sorted(snapshot["_buckets"].items()):
+            metric = _metric_name(name) + "_ms"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip(BUCKETS_MS, counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'{metric}_bucket{{le="{le}"}} {cumulative}')
+            lines.append(f"{metric}_sum {snapshot['_totals_ms'][name]:.3f}")
+            lines.append(f"{metric}_count {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write a snapshot to path (Prometheus text for *.prom, JSON otherwise)."""
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        temp_path = path + ".tmp"
+        try:
+            with open(temp_path, "w") as f:
+                f.write(text)
+            os.replace(temp_path, path)  # readers never see a half-written file
+        except OSError as e:
+            print(f"Error writing metrics to {path}: {e}")
+
+    def start_dump(self, path, interval=10.0):
+        """Write a snapshot to path every `interval` seconds on a background thread."""
+        if not self.enabled or self.dump_thread is not None:
+            return
+        self.dump_stop.clear()
+
+        def run():
+            while not self.dump_stop.wait(interval):
+                self.dump(path)
+            self.dump(path)
+
+        self.dump_thread = threading.Thread(target=run, name="metrics-dump", daemon=True)
+        self.dump_thread.start()
+
+    def stop_dump(self, timeout=1.0):
+        if self.dump_thread is None:
+            return
+        self.dump_stop.set()
+        self.dump_thread.join(timeout)
+        self.dump_thread = None
+
+
+def _metric_name(name):
+    return "faceapp_" + "".join(c if c.isalnum() else "_" for c in name)
+
+
+metrics = Metrics(enabled=os.environ.get("FACEAPP_METRICS") == "1",
+                  overlay=os.environ.get("FACEAPP_METRICS_OVERLAY") == "1")
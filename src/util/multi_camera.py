@@ -0,0 +1,244 @@
+"""
+Multi-camera recognition with shared inference workers.
+
+Each camera or video source keeps its own capture thread (see
+camera_source), but detection, embedding and matching run on one small
+pool of workers shared by every source, sized to the interpreter pool
+rather than to the number of cameras. Workers take a batch of frames
+from several sources at once: each frame is detected on its own, and
+every face of the batch that needs an embedding goes through the model in
+one inference.
+
+Sources are served round robin, so a busy camera cannot starve the
+others. A source is never processed by two workers at once, since its
+tracker state is not shared, and `max_fps` caps how often each source is
+processed. Per-source stats cover frames captured, processed and
+skipped, faces, batch sizes and capture-to-result latency.
+
+Usage:
+    python -m src.util.multi_camera 0 1 clips/entrance.mp4 --max-fps 5 --workers 2
+"""
+
+import argparse
+import json
+import threading
+import time
+
+from src.util.camera_source import open_source
+from src.util.recognition_engine import RecognitionEngine, FaceTracks
+from src.util.metrics import metrics
+from src.util.registry import preload
+
+
+class SourceState:
+    """One source with its own face tracks, rate limit and stats."""
+
+    def __init__(self, name, source, max_fps=None, detect_interval=5):
+        self.name = name
+        self.source = source
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.tracks = FaceTracks(detect_interval)
+        self.logged = set()  # track ids whose final decision was logged
+
+        self.busy = False  # being processed by a worker
+        self.last_seq = 0
+        self.next_due = 0.0  # monotonic time the rate cap allows the next frame
+        self.results = []  # (track id, (name, confidence, relation)) of the last processed frame
+
+        self.processed = 0
+        self.skipped = 0  # captured frames that were never processed
+        self.faces = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def ready(self, now):
+        return (not self.busy and self.source.seq > self.last_seq and now >= self.next_due)
+
+    def stats(self):
+        return {
+            "captured": self.source.seq,
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "faces": self.faces,
+            "tracks": len(self.tracks.tracker.tracks),
+            "avg_latency_ms": 1000 * self.total_latency / self.processed if self.processed else 0.0,
+            "max_latency_ms": 1000 * self.max_latency,
+            "running": self.source.running,
+        }
+
+
+class MultiSourceRecognizer:
+    """
+    Recognises faces from several sources on `num_workers` shared workers.
+    `on_result(name, results)` is called from a worker thread after every
+    processed frame; with `log_decisions` every final decision is recorded
+    in the history once per track. Source names must be unique.
+    """
+
+    def __init__(self, sources, engine=None, num_workers=2, max_batch=4, max_fps=None,
+                 on_result=None, log_decisions=False):
+        sources = list(sources)
+        names = [name for name, _ in sources]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate source names: {', '.join(map(str, duplicates))}")
+
+        self.engine = engine or RecognitionEngine()
+        self.states = [SourceState(name, source, max_fps) for name, source in sources]
+        self.num_workers = num_workers
+        self.max_batch = max_batch
+        self.on_result = on_result
+        self.log_decisions = log_decisions
+
+        self.lock = threading.Lock()
+        self.next_index = 0  # round-robin position
+        self.running = False
+        self.workers = []
+        self.batches = 0
+        self.batched_frames = 0
+
+    def start(self):
+        if self.running:
+            return self
+        self.running = True
+        for state in self.states:
+            state.source.start()
+        self.workers = [threading.Thread(target=self._run, name=f"multi-camera-{i}", daemon=True)
+                        for i in range(self.num_workers)]
+        for worker in self.workers:
+            worker.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self.running = False
+        for worker in self.workers:
+            if worker is not threading.current_thread():
+                worker.join(timeout)
+        self.workers = []
+        for state in self.states:
+            state.source.stop()
+
+    def _take_batch(self):
+        """Claim up to max_batch ready sources, round robin; returns [(state, frame, captured_at)]."""
+        now = time.monotonic()
+        batch = []
+        with self.lock:
+            count = len(self.states)
+            for offset in range(count):
+                state = self.states[(self.next_index + offset) % count]
+                if not state.ready(now):
+                    continue
+                with state.source.condition:
+                    seq, frame, captured_at = state.source.seq, state.source.frame, state.source.timestamp
+                if frame is None:
+                    continue
+                state.busy = True
+                state.skipped += max(seq - state.last_seq - 1, 0)
+                state.last_seq = seq
+                state.next_due = max(state.next_due + state.min_interval, now) if state.min_interval else now
+                batch.append((state, frame, captured_at))
+                if len(batch) == self.max_batch:
+                    self.next_index = (self.next_index + offset + 1) % count
+                    break
+            else:
+                self.next_index = (self.next_index + 1) % max(count, 1)
+        return batch
+
+    def _run(self):
+        while self.running:
+            batch = self._take_batch()
+            if not batch:
+                time.sleep(0.005)
+                continue
+            try:
+                self._process(batch)
+            except Exception as e:
+                print(f"Error processing camera batch: {e}")
+            finally:
+                with self.lock:
+                    for state, _, _ in batch:
+                        state.busy = False
+
+    def _process(self, batch):
+        """Track faces in every frame and embed the stale ones of the whole batch together."""
+        start = metrics.clock()
+        pending = []  # (tracks, track, frame, detection)
+        for state, frame, _ in batch:
+            stale = self.engine.track(state.tracks, frame)
+            if state.tracks.frames_since_detect == 0:
+                state.faces += len(state.tracks.detections)
+            pending += [(state.tracks, track, frame, face) for track, face in stale]
+        self.engine.update_tracks(pending)
+
+        with self.lock:
+            self.batches += 1
+            self.batched_frames += len(batch)
+        metrics.since("multi_camera.batch", start)
+        metrics.count("multi_camera.frames", len(batch))
+
+        done = time.monotonic()
+        for state, frame, captured_at in batch:
+            results = []
+            for track, match in state.tracks.results():
+                results.append((track.track_id, match))
+                decision = state.tracks.votes.decision(track.track_id)
+                if decision is not None and self.log_decisions and track.track_id not in state.logged:
+                    state.logged.add(track.track_id)
+                    self.engine.log(decision, frame)
+            state.logged &= {track.track_id for track in state.tracks.tracker.tracks}
+
+            latency = done - captured_at
+            state.processed += 1
+            state.total_latency += latency
+            state.max_latency = max(state.max_latency, latency)
+            state.results = results
+            if self.on_result:
+                self.on_result(state.name, results)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": len(self.workers),
+                "batches": self.batches,
+                "avg_batch_size": self.batched_frames / self.batches if self.batches else 0.0,
+                "sources": {state.name: state.stats() for state in self.states},
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", help="camera indexes and/or video files or image directories")
+    parser.add_argument("--workers", type=int, default=2, help="shared inference workers")
+    parser.add_argument("--max-batch", type=int, default=4, help="frames taken per worker batch")
+    parser.add_argument("--max-fps", type=float, default=None, help="per-source processing rate cap")
+    parser.add_argument("--duration", type=float, default=None, help="seconds to run (default: until Ctrl+C)")
+    parser.add_argument("--stats-interval", type=float, default=5.0)
+    parser.add_argument("--log", action="store_true", help="record final decisions in the history")
+    args = parser.parse_args()
+    if len(set(args.sources)) != len(args.sources):
+        parser.error("each source may only be given once")
+
+    from src.util.face_manager import init_db
+    init_db()
+
+    sources = [(spec, open_source(spec)) for spec in args.sources]
+    recognizer = MultiSourceRecognizer(sources, num_workers=args.workers, max_batch=args.max_batch,
+                                       max_fps=args.max_fps, log_decisions=args.log)
+    # Load the models and the gallery before the sources start
+    preload(["image_manager", "gallery"]).join()
+    recognizer.start()
+    started = time.monotonic()
+    try:
+        while args.duration is None or time.monotonic() - started < args.duration:
+            time.sleep(args.stats_interval)
+            print(json.dumps(recognizer.stats(), indent=2))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recognizer.stop()
+        if args.log:
+            recognizer.engine.history_writer.close()
+
+
+if __name__ == "__main__":
+    main()
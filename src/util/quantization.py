@@ -0,0 +1,183 @@
+"""
+Compact embedding storage.
+
+Embeddings are stored as raw float32 by default. Two smaller encodings
+are supported, both tagged with a 4-byte header so rows of different
+encodings can live side by side in the same table:
+
+    float16  b"EF16" + float16 values                  (2x smaller)
+    int8     b"EQ8\\0" + float32 scale + int8 values    (4x smaller)
+
+The int8 encoding is symmetric scalar quantisation with one scale per
+vector (max |value| / 127). Int8Matrix keeps a whole gallery in this form,
+a quarter of the float32 memory. Scoring still runs in float32: the codes
+are converted one chunk of rows at a time, so no full-size float32 copy
+of the gallery is ever made, but a search is not faster than float32.
+
+Existing rows can be converted in place, after which the app should be
+started with FACEAPP_FEATURE_ENCODING set to the same encoding:
+
+    python -m src.util.quantization --encoding int8
+"""
+
+import argparse
+import numpy as np
+
+ENCODINGS = ("float32", "float16", "int8")
+FLOAT16_HEADER = b"EF16"
+INT8_HEADER = b"EQ8\0"
+CHUNK_ROWS = 2048  # rows dequantised at a time while scoring; keeps each block in cache
+
+
+def quantize_int8(vectors):
+    """Return (codes, scales): int8 codes and one float32 scale per vector (last axis)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=-1) / 127.0
+    scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+    codes = np.rint(vectors / scales[..., None]).astype(np.int8)
+    return codes, scales
+
+
+def dequantize_int8(codes, scales):
+    return codes.astype(np.float32) * np.asarray(scales, dtype=np.float32)[..., None]
+
+
+def encode_features(vector, encoding="float32"):
+    """Serialise one embedding for the 'features' BLOB columns."""
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    if encoding == "float32":
+        return vector.tobytes()
+    if encoding == "float16":
+        return FLOAT16_HEADER + vector.astype(np.float16).tobytes()
+    if encoding == "int8":
+        codes, scale = quantize_int8(vector)
+        return INT8_HEADER + np.float32(scale).tobytes() + codes.tobytes()
+    raise ValueError(f"Unknown feature encoding: {encoding}")
+
+
+def blob_encoding(blob):
+    """The encoding a stored BLOB was written with."""
+    header = bytes(blob[:4])
+    if header == INT8_HEADER:
+        return "int8"
+    if header == FLOAT16_HEADER:
+        return "float16"
+    return "float32"
+
+
+def decode_blob(blob):
+    """Turn a BLOB written by encode_features back into a float32 vector."""
+    encoding = blob_encoding(blob)
+    if encoding == "int8":
+        scale = np.frombuffer(blob, dtype=np.float32, count=1, offset=4)[0]
+        return np.frombuffer(blob, dtype=np.int8, offset=8).astype(np.float32) * scale
+    if encoding == "float16":
+        return np.frombuffer(blob, dtype=np.float16, offset=4).astype(np.float32)
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+class Int8Matrix:
+    """
+    An int8-quantised stand-in for a float32 array of vectors.
+
+    Supports what FaceGallery and the indexes need from an ndarray:
+    indexing and assignment over the leading axes, `shape`, and `@` with
+    a float32 vector or matrix (computed in float32, one dequantised
+    chunk at a time). np.asarray() gives the dequantised values.
+    """
+
+    def __init__(self, codes, scales):
+        self.codes = codes  # (..., D) int8
+        self.scales = scales  # (...) float32
+
+    @classmethod
+    def empty(cls, shape):
+        return cls(np.zeros(shape, dtype=np.int8), np.ones(shape[:-1], dtype=np.float32))
+
+    @classmethod
+    def from_float(cls, vectors):
+        return cls(*quantize_int8(vectors))
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def ndim(self):
+        return self.codes.ndim
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    def __getitem__(self, key):
+        return Int8Matrix(self.codes[key], self.scales[key])
+
+    def __setitem__(self, key, value):
+        if isinstance(value, Int8Matrix):
+            self.codes[key], self.scales[key] = value.codes, value.scales
+        else:
+            self.codes[key], self.scales[key] = quantize_int8(value)
+
+    def __array__(self, dtype=None, copy=None):
+        values = dequantize_int8(self.codes, self.scales)
+        return values if dtype is None else values.astype(dtype)
+
+    def __matmul__(self, other):
+        other = np.asarray(other, dtype=np.float32)
+        out = np.empty(self.codes.shape[:-1] + other.shape[1:], dtype=np.float32)
+        for start in range(0, max(len(self), 1), CHUNK_ROWS):
+            stop = start + CHUNK_ROWS
+            block = self.codes[start:stop].astype(np.float32) @ other
+            scales = self.scales[start:stop]
+            out[start:stop] = block * (scales if other.ndim == 1 else scales[..., None])
+        return out
+
+
+def migrate(encoding, batch_size=1000):
+    """
+    Re-encode every row of 'faces' and 'face_prototypes' with `encoding`.
+    Returns {table: (rows changed, bytes before, bytes after)}.
+    """
+    from src.util.face_manager import connect
+    from src.util.face_gallery import decode_features  # also folds legacy tiled rows
+
+    conn = connect()
+    report = {}
+    for table in ("faces", "face_prototypes"):
+        changed = before = after = 0
+        rows = conn.execute(f"SELECT id, features FROM {table}").fetchall()
+        for start in range(0, len(rows), batch_size):
+            updates = []
+            for row_id, blob in rows[start:start + batch_size]:
+                before += len(blob)
+                if blob_encoding(blob) == encoding:
+                    after += len(blob)
+                    continue
+                new_blob = encode_features(decode_features(blob), encoding)
+                after += len(new_blob)
+                updates.append((new_blob, row_id))
+            with conn:
+                conn.executemany(f"UPDATE {table} SET features=? WHERE id=?", updates)
+            changed += len(updates)
+        report[table] = (changed, before, after)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-encode stored face embeddings.")
+    parser.add_argument("--encoding", choices=ENCODINGS, required=True)
+    args = parser.parse_args()
+
+    from src.util.face_manager import init_db
+    init_db()
+    for table, (changed, before, after) in migrate(args.encoding).items():
+        print(f"{table}: re-encoded {changed} rows, {before} -> {after} bytes")
+    print(f"Set FACEAPP_FEATURE_ENCODING={args.encoding} so new faces are stored the same way")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Re-embed faces that were enrolled before landmark alignment, from the
+face image saved at enrollment. Faces that can't be re-embedded are
+marked so they can be re-enrolled.
+
+    python -m src.util.realign
+"""
+
+import cv2
+import numpy as np
+
+from src.util.face_manager import init_db, get_unaligned_faces, update_face_features, mark_realign_failed
+
+PADDING = 0.3  # border added on every side, as a fraction of the crop's longer side
+
+
+def realign_face(image_manager, crop):
+    """Aligned embedding of the face in a saved box crop, or None if it is not found again."""
+    border = int(PADDING * max(crop.shape[:2]))
+    image = cv2.copyMakeBorder(crop, border, border, border, border, cv2.BORDER_CONSTANT)
+    faces = image_manager.detect_faces_full(image)
+    if len(faces) == 0:
+        return None
+    box = faces['box']
+    face = faces[int(np.argmax((box[:, 2] - box[:, 0]) * (box[:, 3] - box[:, 1])))]
+    return image_manager.extract_features_aligned(image, face[None])[0]
+
+
+def realign_faces(image_manager=None):
+    """
+    Re-embed every unaligned face. Returns (realigned, [ids of faces that
+    could not be re-embedded]); those are not tried again.
+    """
+    faces = get_unaligned_faces()
+    if not faces:
+        return 0, []
+    if image_manager is None:
+        from src.util.registry import get_image_manager
+        image_manager = get_image_manager()
+
+    realigned, failed = 0, []
+    for face_id, image_path in faces:
+        crop = cv2.imread(image_path) if image_path else None
+        embedding = realign_face(image_manager, crop) if crop is not None and crop.size else None
+        if embedding is None:
+            failed.append(face_id)
+            continue
+        update_face_features(face_id, embedding)
+        realigned += 1
+
+    if failed:
+        mark_realign_failed(failed)
+    return realigned, failed
+
+
+def main():
+    init_db()
+    realigned, failed = realign_faces()
+    print(f"Re-embedded {realigned} faces, {len(failed)} left unaligned")
+    if failed:
+        print(f"Re-enroll these faces: {failed}")
+
+
+if __name__ == "__main__":
+    main()
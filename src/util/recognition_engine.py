@@ -0,0 +1,225 @@
+"""
+The detect / embed / match / log path without any UI.
+
+RecognitionScreen, the multi-camera recognizer and the headless service
+(see recognition_service) all go through RecognitionEngine, so they
+share the models, the gallery, the tracking rules and the matching
+rules. Everything defaults to the shared instances from the registry;
+pass your own for tests or benchmarks.
+"""
+
+import numpy as np
+
+from src.util.face_quality import QualityGate
+from src.util.face_tracker import FaceTracker
+from src.util.vote_aggregator import VoteAggregator
+from src.util.registry import get_image_manager, get_gallery, get_history_writer
+
+UNKNOWN = ("?", 0.0, "?")
+
+
+class FaceTracks:
+    """Face tracks and match votes of one camera or video source."""
+
+    def __init__(self, detect_interval=5, unknown_interval=5):
+        self.tracker = FaceTracker()
+        self.votes = VoteAggregator(required=3, window=3.0)
+        self.detect_interval = detect_interval  # frames between detections while tracking
+        self.unknown_interval = unknown_interval  # detections between embeddings of an unknown face
+        self.frames_since_detect = 0
+        self.detections = None  # FACE_DTYPE array of the latest detection
+        self.visible = []  # tracks seen in the latest detection
+        self.skipped = {}  # track id -> detections skipped since its last embedding
+
+    def reset(self):
+        self.tracker.reset()
+        self.votes.reset()
+        self.frames_since_detect = 0
+        self.detections = None
+        self.visible = []
+        self.skipped = {}
+
+    def prune(self):
+        """Forget the votes and counters of tracks that have ended."""
+        alive = {track.track_id for track in self.tracker.tracks}
+        self.votes.prune(alive)
+        self.skipped = {t: n for t, n in self.skipped.items() if t in alive}
+
+    def backing_off(self, track):
+        """
+        True if a track should skip this detection because it keeps
+        matching nobody: after `votes.required` unknown results in a row
+        it is only embedded every `unknown_interval` detections.
+        """
+        if self.votes.unknown_streak(track.track_id) < self.votes.required:
+            return False
+        skipped = self.skipped.get(track.track_id, 0) + 1
+        if skipped < self.unknown_interval:
+            self.skipped[track.track_id] = skipped
+            return True
+        self.skipped.pop(track.track_id, None)
+        return False
+
+    def results(self):
+        """(track, match) of every visible track, using its final decision when it has one."""
+        results = []
+        for track in self.visible:
+            match = self.votes.decision(track.track_id) or track.match
+            if match is not None:
+                results.append((track, match))
+        return results
+
+    def current_decision(self):
+        """
+        The final voted decision for the largest face currently in view,
+        or None if no visible face has one yet.
+        """
+        visible = [track for track in self.tracker.tracks if track.misses == 0]
+        visible.sort(key=lambda t: (t.box[2] - t.box[0]) * (t.box[3] - t.box[1]), reverse=True)
+        for track in visible:
+            decision = self.votes.decision(track.track_id)
+            if decision is not None:
+                return decision
+        return None
+
+
+class RecognitionEngine:
+    """Face detection, embedding and gallery matching for whole frames."""
+
+    def __init__(self, image_manager=None, gallery=None, history_writer=None,
+                 quality_gate=None, threshold=0.75):
+        self._image_manager = image_manager
+        self._gallery = gallery
+        self._history_writer = history_writer
+        self.quality_gate = quality_gate if quality_gate is not None else QualityGate()
+        self.threshold = threshold  # minimum cosine similarity for a match
+
+    @property
+    def image_manager(self):
+        return self._image_manager or get_image_manager()
+
+    @property
+    def gallery(self):
+        return self._gallery or get_gallery()
+
+    @property
+    def history_writer(self):
+        return self._history_writer or get_history_writer()
+
+    def detect(self, frame):
+        """Detections (FACE_DTYPE) that pass the quality gate, best first."""
+        faces = self.image_manager.detect_faces_full(frame)
+        return faces[self.quality_gate.filter(frame, faces)]
+
+    def embed(self, frame, faces):
+        """Aligned embeddings of the given detections, (N, D)."""
+        return self.image_manager.extract_features_aligned(frame, faces)
+
+    def match(self, embedding):
+        """
+        Compare one embedding to the gallery. Returns (name, confidence,
+        relation) with confidence in percent; below the threshold the name
+        and relation are "?" and the confidence is that of the best score.
+        """
+        best = self.gallery.best_match(embedding)
+        if best is None:
+            return UNKNOWN
+
+        _, name, relation, score = best
+        score = max(score, 0)
+        if score > self.threshold:
+            return name, score * 100, relation
+        return "?", score * 100, "?"
+
+    def match_batch(self, embeddings):
+        return [self.match(embedding) for embedding in embeddings]
+
+    def track(self, tracks, frame):
+        """
+        Advance one source's FaceTracks by a frame. Detection runs every
+        `detect_interval` frames while faces are being tracked. Returns the
+        (track, detection) pairs that need a new embedding: tracks that are
+        new, have moved or gone stale, or have no final decision yet (less
+        often for those that keep matching nobody, see FaceTracks).
+        """
+        tracks.frames_since_detect += 1
+        if tracks.tracker.tracks and tracks.frames_since_detect < tracks.detect_interval:
+            tracks.tracker.step()
+            return []
+
+        tracks.frames_since_detect = 0
+        tracks.detections = self.image_manager.detect_faces_full(frame)
+        tracks.visible = tracks.tracker.update(tracks.detections['box'])
+        tracks.prune()
+
+        # Undecided tracks are embedded on every detection so they collect votes;
+        # crops too poor to give a confident match are not embedded at all
+        stale = []
+        for track in tracks.visible:
+            if tracks.votes.is_final(track.track_id) and not tracks.tracker.needs_embedding(track):
+                continue
+            if tracks.backing_off(track):
+                continue
+            face = tracks.detections[track.detection_index]
+            if self.quality_gate.check(frame, face) is None:
+                stale.append((track, face))
+        return stale
+
+    def update_tracks(self, pending):
+        """
+        Embed and match stale tracks of one or several frames in one
+        batched inference and add the results to their votes. `pending`
+        holds (tracks, track, frame, detection) tuples.
+        """
+        if not pending:
+            return
+        embeddings = self.image_manager.extract_features_aligned_batch(
+            [(frame, face) for _, _, frame, face in pending])
+        for (tracks, track, _, _), embedding in zip(pending, embeddings):
+            track.set_embedding(embedding, self.match(embedding))
+            tracks.votes.add(track.track_id, track.match)
+
+    def process(self, tracks, frame):
+        """track() and update_tracks() for one frame; returns the number of faces embedded."""
+        stale = self.track(tracks, frame)
+        self.update_tracks([(tracks, track, frame, face) for track, face in stale])
+        return len(stale)
+
+    def recognize(self, frame):
+        """Detect, embed and match every usable face in one frame."""
+        return self.recognize_batch([frame])[0]
+
+    def recognize_batch(self, frames):
+        """
+        Recognise the faces in several frames with one batched embedding
+        inference. Returns, per frame, a list of dicts with the face box,
+        detector score, name, confidence and relation.
+        """
+        detections = [self.detect(frame) for frame in frames]
+        embeddings = self.image_manager.extract_features_aligned_batch(
+            [(frame, face) for frame, faces in zip(frames, detections) for face in faces])
+        matches = iter(self.match_batch(embeddings))
+
+        results = []
+        for faces in detections:
+            results.append([
+                dict(zip(("name", "confidence", "relation"), next(matches)),
+                     box=[int(v) for v in face['box']], score=float(face['score']))
+                for face in faces])
+        return results
+
+    def log(self, match, frame):
+        """Record one recognition result and its frame in the history."""
+        name, _, relation = match
+        verified = name != "?"
+        self.history_writer.log(
+            name=name if verified else "Unknown",
+            relation=relation if verified else "Stranger",
+            image_path=self.history_writer.save_image(frame),
+            result="Verified" if verified else "Failed")
+
+
+def as_matrix(embeddings):
+    """Accept one embedding or several; returns a float32 (N, D) matrix."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings.reshape(1, -1) if embeddings.ndim == 1 else embeddings
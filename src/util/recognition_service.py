@@ -0,0 +1,338 @@
+"""
+Headless recognition service for door controllers and other local clients.
+
+A small asyncio HTTP/1.1 server on localhost (or a Unix socket) in front
+of RecognitionEngine. Requests that arrive together are collected into
+one batch, for up to `max_wait` seconds or `max_batch` requests, then
+decoded and run on a worker thread. All faces of a batch go through the
+embedding model in one inference, and the models and gallery are loaded
+once for the lifetime of the process.
+
+Endpoints:
+
+    POST /recognize   body: a JPEG/PNG image
+                      -> {"faces": [{"box", "score", "name", "confidence", "relation"}]}
+                      add ?log=1 to record the best face in the history
+    POST /match       body: JSON {"embeddings": [[...], ...]} or raw float32 bytes;
+                      raw bodies hold one embedding unless ?dim=<size> splits
+                      them into several
+                      -> {"matches": [{"name", "confidence", "relation"}]}
+    GET  /health      -> {"status": "ok", "faces": <gallery size>}
+    GET  /metrics     -> Prometheus text (with FACEAPP_METRICS=1)
+
+Usage:
+    python -m src.util.recognition_service --port 8765
+    python -m src.util.recognition_service --unix /tmp/faceapp.sock
+"""
+
+import argparse
+import asyncio
+import json
+from urllib.parse import urlsplit, parse_qs
+
+import cv2
+import numpy as np
+
+from src.util.face_manager import init_db
+from src.util.metrics import metrics
+from src.util.realign import realign_faces
+from src.util.recognition_engine import RecognitionEngine, as_matrix
+from src.util.registry import preload, get_gallery, get_history_writer, is_loaded
+
+MAX_BODY_BYTES = 10 * 2**20
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class RequestBatcher:
+    """
+    Collects concurrent requests of one kind and hands them to
+    `run_batch(items)` (called on a worker thread) as a single list.
+    """
+
+    def __init__(self, run_batch, max_batch=8, max_wait=0.005, name="batch"):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait  # seconds to wait for more requests once one arrived
+        self.name = name
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            metrics.count(f"service.{self.name}.batches")
+            metrics.count(f"service.{self.name}.requests", len(batch))
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(None, self.run_batch, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class RecognitionService:
+    """Routes HTTP requests to a RecognitionEngine through the batchers."""
+
+    def __init__(self, engine=None, max_batch=8, max_wait=0.005):
+        self.engine = engine or RecognitionEngine()
+        self.frames = RequestBatcher(self._recognize_batch, max_batch, max_wait, name="recognize")
+        self.embeddings = RequestBatcher(self._match_batch, max_batch * 8, max_wait, name="match")
+
+    def _recognize_batch(self, items):
+        # Images are decoded here, in the executor, so a large upload doesn't
+        # stall the event loop; one that can't be decoded fails on its own.
+        frames = [cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+                  for body, _ in items]
+        results = iter(self.engine.recognize_batch([frame for frame in frames if frame is not None]))
+        responses = []
+        for frame, (_, log) in zip(frames, items):
+            if frame is None:
+                responses.append(HTTPError(400, "Body is not a decodable image"))
+                continue
+            faces = next(results)
+            if log and faces:
+                best = faces[0]
+                self.engine.log((best["name"], best["confidence"], best["relation"]), frame)
+            responses.append(faces)
+        return responses
+
+    def _match_batch(self, items):
+        # Every request may carry several embeddings; match them all together.
+        # While the gallery is empty the first request sets the size, and a
+        # request of another size fails on its own, not the whole batch.
+        dim = items[0].shape[1]
+        matches = iter(self.engine.match_batch(np.vstack([item for item in items if item.shape[1] == dim])))
+        results = []
+        for item in items:
+            if item.shape[1] != dim:
+                results.append(HTTPError(400, f"Embeddings must have {dim} values"))
+            else:
+                results.append([dict(zip(("name", "confidence", "relation"), next(matches))) for _ in item])
+        return results
+
+    async def start(self):
+        self.frames.start()
+        self.embeddings.start()
+
+    async def stop(self):
+        await self.frames.stop()
+        await self.embeddings.stop()
+
+    async def handle(self, method, target, headers, body):
+        """Return (status, content type, payload bytes) for one request."""
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+
+        if url.path == "/health":
+            return 200, "application/json", _json({"status": "ok", "faces": len(self.engine.gallery)})
+        if url.path == "/metrics":
+            return 200, "text/plain; version=0.0.4", metrics.to_prometheus().encode()
+        if url.path not in ("/recognize", "/match"):
+            raise HTTPError(404, f"Unknown path: {url.path}")
+        if method != "POST":
+            raise HTTPError(405, "Use POST")
+
+        if url.path == "/recognize":
+            log = query.get("log", ["0"])[0] in ("1", "true", "yes")
+            faces = await self.frames.submit((body, log))
+            if isinstance(faces, HTTPError):
+                raise faces
+            return 200, "application/json", _json({"faces": faces})
+
+        embeddings = _parse_embeddings(body, headers.get("content-type", ""), query.get("dim", [None])[0])
+        gallery = self.engine.gallery
+        if len(gallery) and embeddings.shape[1] != gallery.dim:
+            raise HTTPError(400, f"Embeddings must have {gallery.dim} values")
+        matches = await self.embeddings.submit(embeddings)
+        if isinstance(matches, HTTPError):
+            raise matches
+        return 200, "application/json", _json({"matches": matches})
+
+    async def serve_connection(self, reader, writer):
+        """Handle HTTP/1.1 requests on one connection until it is closed."""
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+
+                start = metrics.clock()
+                try:
+                    status, content_type, payload = await self.handle(method, target, headers, body)
+                except HTTPError as e:
+                    status, content_type, payload = e.status, "application/json", _json({"error": str(e)})
+                except Exception as e:
+                    print(f"Error handling {method} {target}: {e}")
+                    status, content_type, payload = 500, "application/json", _json({"error": str(e)})
+                metrics.since("service.request", start)
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(_response(status, content_type, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except HTTPError as e:
+            writer.write(_response(e.status, "application/json", _json({"error": str(e)}), False))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _read_request(reader):
+    """Read one request; returns (method, target, headers, body) or None at end of stream."""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", "0") or 0)
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length < 0:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"Body larger than {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+def _parse_embeddings(body, content_type, dim=None):
+    """Embeddings of a /match body as an (N, D) matrix; `dim` splits a raw body into rows."""
+    if content_type.startswith("application/json"):
+        try:
+            matrix = as_matrix(json.loads(body)["embeddings"])
+        except (ValueError, KeyError, TypeError):
+            raise HTTPError(400, 'Expected {"embeddings": [[...], ...]}')
+    else:
+        if len(body) % 4:
+            raise HTTPError(400, "Raw embeddings must be float32 bytes")
+        matrix = as_matrix(np.frombuffer(body, dtype=np.float32))
+        if dim is not None:
+            try:
+                dim = int(dim)
+            except ValueError:
+                raise HTTPError(400, "dim must be an integer")
+            if dim <= 0 or matrix.size % dim:
+                raise HTTPError(400, f"Raw body does not hold a whole number of {dim}-value embeddings")
+            matrix = matrix.reshape(-1, dim)
+    if matrix.size == 0 or matrix.ndim != 2:
+        raise HTTPError(400, "No embeddings given")
+    return matrix
+
+
+def _json(data):
+    return json.dumps(data).encode()
+
+
+def _response(status, content_type, payload, keep_alive=True):
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + payload
+
+
+async def serve(host="127.0.0.1", port=8765, unix_path=None, max_batch=8, max_wait=0.005):
+    init_db()
+    # Load the models and the gallery before accepting requests
+    done = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    preload(["image_manager", "gallery"], on_done=lambda: loop.call_soon_threadsafe(done.set))
+    await done.wait()
+    _, failed = await loop.run_in_executor(None, realign_faces)
+    if failed:
+        print(f"{len(failed)} faces enrolled before alignment could not be re-embedded "
+              f"and should be re-enrolled: {failed}")
+
+    service = RecognitionService(max_batch=max_batch, max_wait=max_wait)
+    await service.start()
+    if unix_path:
+        server = await asyncio.start_unix_server(service.serve_connection, path=unix_path)
+        where = unix_path
+    else:
+        server = await asyncio.start_server(service.serve_connection, host, port)
+        where = f"http://{host}:{port}"
+    print(f"Recognition service listening on {where}")
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+        if is_loaded("history_writer"):
+            get_history_writer().close()
+        if is_loaded("gallery"):
+            get_gallery().close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (keep it local)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--max-batch", type=int, default=8, help="frames embedded in one batch")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="how long to wait for more requests to batch together")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.max_batch, args.max_wait_ms / 1000))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
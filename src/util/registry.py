@@ -0,0 +1,90 @@
+"""
+Shared, lazily created models and engines. Each one is created on first
+use, and preload() creates them on a background thread at startup.
+"""
+
+import threading
+
+from src.util.startup_timer import startup_timer
+
+
+def _create_image_manager():
+    from src.util.image_manager import ImageManager
+    return ImageManager()
+
+
+def _create_voice_manager():
+    from src.util.voice_manager import VoiceManager
+    return VoiceManager()
+
+
+def _create_gallery():
+    from src.util.face_gallery import FaceGallery
+    from src.util.face_index import create_index
+    from src.util.face_manager import FEATURE_ENCODING
+    # Compactly stored embeddings are also kept compact in memory
+    return FaceGallery(index=create_index(), quantized=FEATURE_ENCODING == "int8")
+
+
+def _create_history_writer():
+    from src.util.history_writer import HistoryWriter
+    return HistoryWriter()
+
+
+_factories = {
+    "image_manager": _create_image_manager,
+    "voice_manager": _create_voice_manager,
+    "gallery": _create_gallery,
+    "history_writer": _create_history_writer,
+}
+_instances = {}
+_locks = {name: threading.Lock() for name in _factories}
+
+
+def get(name):
+    """Return the shared instance called `name`, creating it on first use."""
+    instance = _instances.get(name)
+    if instance is None:
+        with _locks[name]:
+            instance = _instances.get(name)
+            if instance is None:
+                with startup_timer.phase(f"load {name}"):
+                    instance = _factories[name]()
+                _instances[name] = instance
+    return instance
+
+
+def is_loaded(name):
+    return name in _instances
+
+
+def get_image_manager():
+    return get("image_manager")
+
+
+def get_voice_manager():
+    return get("voice_manager")
+
+
+def get_gallery():
+    return get("gallery")
+
+
+def get_history_writer():
+    return get("history_writer")
+
+
+def preload(names=None, on_done=None):
+    """Create the given instances (default: all) on a background thread."""
+    def run():
+        for name in names or _factories:
+            try:
+                get(name)
+            except Exception as e:
+                print(f"Error loading {name}: {e}")
+        if on_done:
+            on_done()
+
+    thread = threading.Thread(target=run, name="preload", daemon=True)
+    thread.start()
+    return thread
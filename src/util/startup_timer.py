@@ -0,0 +1,55 @@
+"""
+Optional startup profiling. Set FACEAPP_STARTUP_PROFILE=1 to print how
+long each startup phase (imports, database, UI build, model loading)
+took once the app and its background model loading have finished.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """Collects (phase, start, duration) records relative to process start."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.phases = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Time the body of a with-block as one phase."""
+        if not self.enabled:
+            yield
+            return
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, begin, time.perf_counter() - begin)
+
+    def mark(self, name):
+        """Record a phase that ran from process start until now."""
+        if self.enabled:
+            self.record(name, self.start, time.perf_counter() - self.start)
+
+    def record(self, name, begin, duration):
+        with self.lock:
+            self.phases.append((name, begin, duration))
+
+    def report(self):
+        """Print every recorded phase in the order it started."""
+        if not self.enabled:
+            return
+        with self.lock:
+            phases = sorted(self.phases, key=lambda p: p[1])
+        print("Startup profile:")
+        for name, begin, duration in phases:
+            print(f"  {name:<28} start {1000 * (begin - self.start):8.1f} ms   took {1000 * duration:8.1f} ms")
+        print(f"  {'total':<28} {1000 * (time.perf_counter() - self.start):8.1f} ms")
+
+
+startup_timer = StartupTimer(enabled=os.environ.get("FACEAPP_STARTUP_PROFILE") == "1")
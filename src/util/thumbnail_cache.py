@@ -0,0 +1,253 @@
+"""
+Small thumbnails for the face and history lists, stored under THUMB_DIR
+by the SHA-1 of the source image and evicted oldest first once the cache
+grows past MAX_CACHE_BYTES.
+
+Regenerate thumbnails for existing data with:
+    python -m src.util.thumbnail_cache --rebuild
+"""
+
+import argparse
+import hashlib
+import os
+import queue
+import shutil
+import threading
+import cv2
+
+from src.util.face_manager import connect, init_db
+
+THUMB_DIR = "thumbnails"
+THUMB_SIZE = 128  # longest side, in pixels
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+PLACEHOLDER = ""  # shown until a missing thumbnail has been created
+
+_lock = threading.Lock()
+_cache_bytes = None  # total size of THUMB_DIR, computed on first use
+
+# Thumbnails being created in the background: source path -> on_ready callbacks
+_pending = {}
+_pending_lock = threading.Lock()
+_requests = queue.Queue()
+_worker = None
+
+
+def _file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _thumb_path(digest):
+    return os.path.join(THUMB_DIR, f"{digest}.jpg")
+
+
+def write_thumbnail(source_path, image=None):
+    """
+    Write (or reuse) the thumbnail file of an image without recording it.
+    Returns (digest, thumbnail path, created), or None if the image
+    cannot be read. Safe to call from other processes (see bulk_import).
+    """
+    digest = _file_digest(source_path)
+    thumb_path = _thumb_path(digest)
+
+    if os.path.exists(thumb_path):
+        os.utime(thumb_path)
+        return digest, thumb_path, False
+
+    if image is None:
+        image = cv2.imread(source_path)
+        if image is None:
+            return None
+
+    h, w = image.shape[:2]
+    scale = THUMB_SIZE / max(h, w)
+    if scale < 1:
+        image = cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+
+    os.makedirs(THUMB_DIR, exist_ok=True)
+    cv2.imwrite(thumb_path, image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return digest, thumb_path, True
+
+
+def create_thumbnail(source_path, image=None):
+    """
+    Create (or reuse) the thumbnail of an image file that was just saved
+    and return its path. Pass the decoded `image` if it is already in
+    memory to avoid decoding the file again.
+    """
+    written = write_thumbnail(source_path, image)
+    if written is None:
+        return None
+    digest, thumb_path, created = written
+    if created:
+        _account(thumb_path)
+
+    conn = connect()
+    with conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO thumbnails (source_path, digest, source_mtime)
+            VALUES (?, ?, ?)
+        """, (source_path, digest, os.path.getmtime(source_path)))
+    return thumb_path
+
+
+def register_thumbnails(entries):
+    """
+    Record thumbnails written by write_thumbnail elsewhere, given as
+    (source path, digest) pairs, in one transaction, then trim the cache.
+    """
+    global _cache_bytes
+    rows = []
+    for source_path, digest in entries:
+        try:
+            rows.append((source_path, digest, os.path.getmtime(source_path)))
+        except OSError:
+            pass
+    if not rows:
+        return
+
+    conn = connect()
+    with conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO thumbnails (source_path, digest, source_mtime)
+            VALUES (?, ?, ?)
+        """, rows)
+
+    # Files written by other processes are not counted yet; measure the folder again
+    with _lock:
+        _cache_bytes = None
+    _account(_thumb_path(rows[-1][1]))
+
+
+def cached_thumbnail(source_path):
+    """The up-to-date thumbnail of an image, or None if it is missing or stale."""
+    row = connect().execute(
+        "SELECT digest, source_mtime FROM thumbnails WHERE source_path = ?", (source_path,)
+    ).fetchone()
+
+    try:
+        if row and row[1] == os.path.getmtime(source_path):
+            thumb_path = _thumb_path(row[0])
+            if os.path.exists(thumb_path):
+                return thumb_path
+    except OSError:
+        pass
+    return None
+
+
+def load_thumbnail(source_path, on_ready):
+    """
+    Return the thumbnail path to display for an image right away: the
+    cached one, or PLACEHOLDER if it is missing or stale. In that case it
+    is created on a background thread, which then calls
+    on_ready(thumbnail path); nothing is called if it cannot be created.
+    """
+    global _worker
+    if not source_path or not os.path.exists(source_path):
+        return PLACEHOLDER
+    thumb_path = cached_thumbnail(source_path)
+    if thumb_path:
+        return thumb_path
+
+    with _pending_lock:
+        callbacks = _pending.get(source_path)
+        if callbacks is not None:
+            callbacks.append(on_ready)
+            return PLACEHOLDER
+        _pending[source_path] = [on_ready]
+        if _worker is None:
+            _worker = threading.Thread(target=_create_pending, name="thumbnails", daemon=True)
+            _worker.start()
+    _requests.put(source_path)
+    return PLACEHOLDER
+
+
+def _create_pending():
+    while True:
+        source_path = _requests.get()
+        try:
+            thumb_path = create_thumbnail(source_path)
+        except (OSError, cv2.error) as e:
+            print(f"Error creating thumbnail for {source_path}: {e}")
+            thumb_path = None
+
+        with _pending_lock:
+            callbacks = _pending.pop(source_path, [])
+        if thumb_path:
+            for callback in callbacks:
+                try:
+                    callback(thumb_path)
+                except Exception as e:
+                    print(f"Error in thumbnail callback: {e}")
+
+
+def _account(thumb_path):
+    """Add a new thumbnail to the cache size and evict the oldest ones if over budget."""
+    global _cache_bytes
+    with _lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(entry.stat().st_size for entry in os.scandir(THUMB_DIR))
+        else:
+            _cache_bytes += os.path.getsize(thumb_path)
+
+        if _cache_bytes <= MAX_CACHE_BYTES:
+            return
+
+        # Least recently used first (access refreshes the mtime)
+        entries = sorted(os.scandir(THUMB_DIR), key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if _cache_bytes <= MAX_CACHE_BYTES * 0.9:
+                break
+            if os.path.samefile(entry.path, thumb_path):
+                continue
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+                _cache_bytes -= size
+            except OSError:
+                pass
+
+
+def rebuild(clear=False):
+    """Create thumbnails for every face and history image in the database."""
+    global _cache_bytes
+    init_db()
+    conn = connect()
+    if clear:
+        with conn:
+            conn.execute("DELETE FROM thumbnails")
+        shutil.rmtree(THUMB_DIR, ignore_errors=True)
+        with _lock:
+            _cache_bytes = None
+
+    paths = [row[0] for row in conn.execute("SELECT image_path FROM faces")]
+    paths += [row[0] for row in conn.execute("SELECT DISTINCT image_path FROM recognitions")]
+
+    created = missing = 0
+    for path in paths:
+        if not path or not os.path.exists(path):
+            missing += 1
+            continue
+        if create_thumbnail(path):
+            created += 1
+    print(f"Thumbnails: {created} created or refreshed, {missing} source images missing")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the list thumbnail cache.")
+    parser.add_argument("--rebuild", action="store_true", help="create thumbnails for all existing images")
+    parser.add_argument("--clear", action="store_true", help="delete all existing thumbnails first")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        rebuild(clear=args.clear)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ providing simple methods to speak various messages in the background.
 """
 import logging
 logging.getLogger("comtypes").setLevel(logging.ERROR)
+import queue
 from threading import Thread
 
 import platform
@@ -20,37 +21,49 @@ if platform.system() == "Linux":
 class VoiceManager:
     """
     Handles all spoken feedback to the user.
-    Uses pyttsx3 to speak asynchronously on a separate thread.
+    The TTS engine is created and driven by one dedicated thread,
+    so callers on any thread never block on speech.
     """
     def __init__(self):
         self.is_speaking = False
         self.tts = None
+        self.texts = queue.Queue()
+        Thread(target=self._run, name="tts", daemon=True).start()
 
-        if platform.system() == "Linux" and AndroidTTS:
-            self.tts = AndroidTTS(PythonActivity.mActivity, None)
-        else:
-            import pyttsx3
-            self.tts = pyttsx3.init()
-            self.tts.setProperty('rate', 150)
-            self.tts.setProperty('volume', 1.0)
+    def _run(self):
+        """TTS thread: create the engine, then speak queued texts one at a time."""
+        try:
+            if platform.system() == "Linux" and AndroidTTS:
+                self.tts = AndroidTTS(PythonActivity.mActivity, None)
+            else:
+                import pyttsx3
+                self.tts = pyttsx3.init()
+                self.tts.setProperty('rate', 150)
+                self.tts.setProperty('volume', 1.0)
+        except Exception as e:
+            print(f"Error starting text-to-speech: {e}")
+            return
+
+        while True:
+            text = self.texts.get()
+            try:
+                if AndroidTTS and platform.system() == "Linux":
+                    self.tts.speak(text, AndroidTTS.QUEUE_FLUSH, None)
+                else:
+                    self.tts.say(text)
+                    self.tts.runAndWait()
+            except Exception as e:
+                print(f"Error speaking: {e}")
+            self.is_speaking = False
 
     def speak(self, text):
         """
-        Plays the given text in a separate thread
-        so it won't block the main application.
+        Queue the given text for the TTS thread so it won't block
+        the main application. Ignored while something is being said.
         """
-        def run():
-            self.is_speaking = True
-            if AndroidTTS and platform.system() == "Linux":
-                self.tts.speak(text, AndroidTTS.QUEUE_FLUSH, None)
-            else:
-                self.tts.say(text)
-                self.tts.runAndWait()
-            self.is_speaking = False
-        
         if not self.is_speaking:
-            thread = Thread(target=run)
-            thread.start()
+            self.is_speaking = True
+            self.texts.put(text)
     
     def verification_success(self, name, relation):
         """
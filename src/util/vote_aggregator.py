@@ -0,0 +1,92 @@
+"""
+Temporal vote aggregation for recognition decisions.
+
+A single frame can be blurry or caught mid-turn, so deciding from one
+detect/embed/match is noisy. The aggregator keeps a short rolling window
+of match results per tracked face. Once `required` consecutive results
+inside the window agree on the same known identity (a match above the
+recognition threshold), the decision is final for that track and later
+frames don't change it.
+
+"Unknown" results are never final: the person may just have been caught
+at a bad angle, so the track keeps being matched and can still be
+recognised later. Until then its latest result is only provisional.
+unknown_streak() tells how many unknown results in a row a track has had,
+so callers can match it less often.
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class VoteAggregator:
+    """Rolling per-track window of (name, confidence, relation) match results."""
+
+    UNKNOWN_NAME = "?"
+
+    def __init__(self, required=3, window=3.0):
+        self.required = required  # consistent known results needed for a final decision
+        self.window = window  # seconds a result stays in the window
+        self.lock = threading.Lock()
+        self.votes = {}  # track id -> deque of (time, name, confidence, relation)
+        self.final = {}  # track id -> (name, confidence, relation)
+        self.unknown = {}  # track id -> consecutive unknown results
+
+    def reset(self):
+        with self.lock:
+            self.votes.clear()
+            self.final.clear()
+            self.unknown.clear()
+
+    def add(self, track_id, match, now=None):
+        """
+        Record one match result for a track. Returns the final decision
+        once there is one, otherwise None.
+        """
+        now = time.monotonic() if now is None else now
+        name, confidence, relation = match
+
+        with self.lock:
+            if track_id in self.final:
+                return self.final[track_id]
+
+            if name == self.UNKNOWN_NAME:
+                self.unknown[track_id] = self.unknown.get(track_id, 0) + 1
+            else:
+                self.unknown.pop(track_id, None)
+
+            votes = self.votes.setdefault(track_id, deque(maxlen=self.required))
+            votes.append((now, name, confidence, relation))
+            while votes and now - votes[0][0] > self.window:
+                votes.popleft()
+
+            if (name != self.UNKNOWN_NAME and len(votes) == self.required
+                    and all(vote[1] == name for vote in votes)):
+                mean_confidence = sum(vote[2] for vote in votes) / len(votes)
+                self.final[track_id] = (name, mean_confidence, relation)
+                self.votes.pop(track_id, None)
+                return self.final[track_id]
+        return None
+
+    def decision(self, track_id):
+        """The final (name, confidence, relation) for a track, or None."""
+        with self.lock:
+            return self.final.get(track_id)
+
+    def is_final(self, track_id):
+        with self.lock:
+            return track_id in self.final
+
+    def unknown_streak(self, track_id):
+        """Number of unknown results in a row for a track."""
+        with self.lock:
+            return self.unknown.get(track_id, 0)
+
+    def prune(self, track_ids):
+        """Forget every track that is not in track_ids."""
+        keep = set(track_ids)
+        with self.lock:
+            self.votes = {t: v for t, v in self.votes.items() if t in keep}
+            self.final = {t: d for t, d in self.final.items() if t in keep}
+            self.unknown = {t: n for t, n in self.unknown.items() if t in keep}